@@ -0,0 +1,120 @@
+import asyncio
+import os
+from collections import OrderedDict
+
+
+class AudioCache:
+    def __init__(self, directory: str, max_bytes: int, max_fills: int = 2, max_track_s: int = 20 * 60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_fills = max_fills
+        self.max_track_s = max_track_s
+        self.entries: OrderedDict[str, int] = None
+        self.total_bytes = 0
+        self.filling: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        # the directory is scanned on first use, least recently played files first
+        if self.entries is None:
+            os.makedirs(self.directory, exist_ok=True)
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith('.webm'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+                elif entry.is_file() and entry.name.endswith('.part'):
+                    os.remove(entry.path)
+            self.entries = OrderedDict((id, size) for _, id, size in sorted(files))
+            self.total_bytes = sum(self.entries.values())
+        return self.entries
+
+    def get_file_path(self, id: str):
+        return os.path.join(self.directory, f'{id}.webm')
+
+    def get_path(self, id: str, count: bool = True):
+        # prefetches and restarts of the playing track look up the same song again, only the lookup that plays it counts
+        entries = self.load()
+        if id not in entries:
+            if count:
+                self.record(False)
+            return None
+        if count:
+            self.record(True)
+        entries.move_to_end(id)
+        path = self.get_file_path(id)
+        # the modification time doubles as the last play time, so the LRU order survives a restart
+        os.utime(path)
+        return path
+
+    def record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def fill(self, id: str, source: str, length_s: int):
+        entries = self.load()
+        if id in entries or id in self.filling or len(self.filling) >= self.max_fills or length_s > self.max_track_s:
+            return
+        task = asyncio.create_task(self.download(id, source))
+        self.filling[id] = task
+        task.add_done_callback(lambda _: self.filling.pop(id, None))
+
+    async def download(self, id: str, source: str):
+        path = self.get_file_path(id)
+        part_path = path + '.part'
+        # YouTube's best audio is usually Opus already, so it is copied as is and only re-encoded when it is not
+        for codec_options in (['-c:a', 'copy'], ['-c:a', 'libopus', '-b:a', '128k']):
+            process = await asyncio.create_subprocess_exec(
+                'ffmpeg', '-y', '-loglevel', 'error',
+                '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+                '-i', source, '-vn', *codec_options, '-f', 'webm', part_path,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            try:
+                returncode = await process.wait()
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+            if returncode == 0:
+                break
+        else:
+            print(f'[AudioCache] could not download {id}')
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            return
+
+        os.replace(part_path, path)
+        size = os.path.getsize(path)
+        self.entries[id] = size
+        self.total_bytes += size
+        self.evict()
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            id, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.get_file_path(id))
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        for task in list(self.filling.values()):
+            task.cancel()
+
+    def get_stats(self):
+        return {
+            'files': len(self.entries) if self.entries is not None else 0,
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'filling': len(self.filling),
+        }
@@ -0,0 +1,65 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable
+
+
+class MicroBatcher:
+    def __init__(self, predict_batch: Callable[[list[str]], list[Any]], max_batch_size: int = 16, max_wait_ms: float = 5, num_workers: int = 1):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue: queue.Queue[tuple[str, Future]] = queue.Queue()
+        self.histogram: Counter[int] = Counter()
+        self.lock = threading.Lock()
+
+        self.workers = [threading.Thread(target=self.run, name=f'MicroBatcher-{i}', daemon=True) for i in range(num_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, text: str):
+        future = Future()
+        self.queue.put((text, future))
+        return future
+
+    def collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(self.queue.get(timeout=timeout))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        # callers that gave up while waiting (e.g. a cancelled asyncio.wrap_future) are dropped here
+        return [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            if not batch:
+                continue
+
+            with self.lock:
+                self.histogram[len(batch)] += 1
+
+            try:
+                results = self.predict_batch([text for text, _ in batch])
+            except Exception as e:
+                print(f'[MicroBatcher] {e}')
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def get_histogram(self):
+        with self.lock:
+            return dict(sorted(self.histogram.items()))
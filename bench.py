@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+
+import aiohttp
+
+
+def load_corpus(path: str):
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def summarize(latencies: list[float]):
+    if len(latencies) < 2:
+        return {'count': len(latencies)}
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {'count': len(latencies), 'p50_ms': quantiles[49], 'p95_ms': quantiles[94], 'p99_ms': quantiles[98]}
+
+
+async def drive(send, corpus: list[str], args: argparse.Namespace):
+    # open loop with Poisson arrivals when --rate is set, otherwise --concurrency closed-loop clients
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    rng = random.Random(args.seed)
+
+    sent = 0
+
+    async def one():
+        nonlocal errors, sent
+        messages = [rng.choice(corpus) for _ in range(args.batch)]
+        if args.unique:
+            # a suffix per message keeps the server's prediction cache from answering repeats of the small corpus
+            messages = [f'{message} {sent + i}' for i, message in enumerate(messages)]
+            sent += len(messages)
+        # timed from arrival, so waiting for a free client slot counts as latency
+        start = time.perf_counter()
+        async with semaphore:
+            try:
+                await send(messages)
+            except Exception as e:
+                errors += 1
+                if errors <= 5:
+                    print(f'[bench] {e!r}')
+                return
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    if args.rate > 0:
+        tasks = []
+        for _ in range(args.requests):
+            tasks.append(asyncio.create_task(one()))
+            await asyncio.sleep(rng.expovariate(args.rate))
+        await asyncio.gather(*tasks)
+    else:
+        remaining = args.requests
+
+        async def client():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                await one()
+
+        await asyncio.gather(*[client() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': len(latencies) / elapsed,
+        'throughput_msgs': len(latencies) * args.batch / elapsed,
+        'latency': summarize(latencies),
+    }
+
+
+async def run_http(corpus: list[str], args: argparse.Namespace):
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=args.timeout)) as session:
+        async def send(messages: list[str]):
+            if args.endpoint == 'classify':
+                async with session.post(f'{args.url}/classify', json=messages) as response:
+                    response.raise_for_status()
+                    await response.json()
+            else:
+                async with session.get(f'{args.url}/', params={'message': messages[0]}) as response:
+                    response.raise_for_status()
+                    await response.text()
+
+        async with session.post(f'{args.url}/stats/reset') as response:
+            response.raise_for_status()
+        result = await drive(send, corpus, args)
+        async with session.get(f'{args.url}/stats') as response:
+            result['server'] = await response.json()
+    return result
+
+
+def build_stub_classifier(corpus: list[str]):
+    # a randomly initialised two-layer ELECTRA over a character vocabulary of the corpus, no weights are downloaded
+    from transformers import BertTokenizerFast, ElectraConfig, ElectraForSequenceClassification
+
+    import torch
+    from classifier import NUM_LABELS, TorchBackend
+
+    torch.manual_seed(0)
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'] + sorted({char for text in corpus for char in text if not char.isspace()})
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', encoding='utf-8', delete=False) as f:
+        f.write('\n'.join(vocab))
+    tokenizer = BertTokenizerFast(vocab_file=f.name, do_lower_case=False, tokenize_chinese_chars=False)
+
+    config = ElectraConfig(
+        vocab_size=len(vocab),
+        embedding_size=32,
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=64,
+        max_position_embeddings=512,
+        num_labels=NUM_LABELS,
+    )
+    model = ElectraForSequenceClassification(config).eval()
+    return tokenizer, TorchBackend(model, torch.device('cpu'))
+
+
+async def run_offline(corpus: list[str], args: argparse.Namespace):
+    from batcher import MicroBatcher
+    from classifier import predict_batch
+    from timings import StageTimings
+
+    tokenizer, backend = build_stub_classifier(corpus)
+    timings = StageTimings()
+    batcher = MicroBatcher(lambda texts: predict_batch(tokenizer, backend, texts, timings=timings), max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+
+    async def send(messages: list[str]):
+        await asyncio.gather(*[asyncio.wrap_future(batcher.submit(message)) for message in messages])
+
+    result = await drive(send, corpus, args)
+    result['server'] = {'batch_size_histogram': batcher.get_histogram(), 'timings': timings.get_summary()}
+    return result
+
+
+def print_result(result: dict):
+    print(f'requests: {result["requests"]} (errors {result["errors"]})')
+    print(f'throughput: {result["throughput_rps"]:.1f} req/s, {result["throughput_msgs"]:.1f} msg/s')
+    latency = result['latency']
+    if 'p50_ms' in latency:
+        print(f'latency: p50 {latency["p50_ms"]:.2f}ms, p95 {latency["p95_ms"]:.2f}ms, p99 {latency["p99_ms"]:.2f}ms')
+
+    server = result.get('server', {})
+    if 'batch_size_histogram' in server:
+        print(f'batch sizes: {server["batch_size_histogram"]}')
+    if 'cache' in server:
+        cache = server['cache']
+        lookups = cache['hits'] + cache['misses']
+        hit_rate = cache['hits'] / lookups * 100 if lookups else 0
+        print(f'cache: {cache["hits"]} hits, {cache["misses"]} misses ({hit_rate:.1f}% hits)')
+    for stage, summary in server.get('timings', {}).items():
+        print(f'{stage:<13} n={summary["count"]:<6} p50 {summary["p50_ms"]:.2f}ms, p95 {summary["p95_ms"]:.2f}ms, p99 {summary["p99_ms"]:.2f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the inference server, or the classification path offline with a stub model')
+    parser.add_argument('--corpus', default='bench_corpus.txt')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--endpoint', choices=['index', 'classify'], default='index')
+    parser.add_argument('--batch', type=int, default=1, help='messages per request, only used by /classify and --offline')
+    parser.add_argument('--offline', action='store_true', help='skip HTTP and run MicroBatcher + predict_batch on a tiny random model')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=0, help='mean arrivals per second, 0 for closed-loop clients')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--unique', action='store_true', help='make every message distinct, so the server cache never answers')
+    args = parser.parse_args()
+
+    if args.endpoint == 'index' and not args.offline:
+        args.batch = 1
+
+    corpus = load_corpus(args.corpus)
+    result = asyncio.run(run_offline(corpus, args) if args.offline else run_http(corpus, args))
+    print_result(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import resource
+import time
+
+import discord
+
+from cogs.music import create_audio
+
+
+FRAME_S = discord.opus.Encoder.FRAME_LENGTH / 1000
+
+
+def get_cpu_seconds():
+    # FFmpeg runs in child processes, their time is only counted once they have been waited for
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def run(mode: str, source: str, streams: int, seconds: float, volume: float):
+    encoder = discord.opus.Encoder() if mode == 'pcm' else None
+    frames_per_stream = int(seconds / FRAME_S)
+
+    start_cpu = get_cpu_seconds()
+    start = time.perf_counter()
+    audios = [create_audio(source, volume, mode=mode) for _ in range(streams)]
+    frames = 0
+    # read the streams round-robin, like the voice players of that many guilds would
+    for _ in range(frames_per_stream):
+        for audio in audios:
+            data = audio.read()
+            if not data:
+                continue
+            frames += 1
+            if encoder is not None:
+                encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+    for audio in audios:
+        audio.cleanup()
+    cpu = get_cpu_seconds() - start_cpu
+    wall = time.perf_counter() - start
+
+    audio_seconds = frames * FRAME_S
+    return {
+        'mode': mode,
+        'audio_s': audio_seconds,
+        'cpu_s': cpu,
+        'wall_s': wall,
+        'streams_per_core': audio_seconds / cpu if cpu else float('inf'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare CPU cost per playback stream of the opus and pcm playback modes')
+    parser.add_argument('source', help='a local audio file or stream url, as handed to FFmpeg by the music cog')
+    parser.add_argument('--streams', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=30, help='audio seconds read from every stream')
+    parser.add_argument('--volume', type=float, default=0.1)
+    parser.add_argument('--modes', nargs='+', choices=['opus', 'pcm'], default=['opus', 'pcm'])
+    args = parser.parse_args()
+
+    if 'pcm' in args.modes and not discord.opus.is_loaded():
+        discord.opus._load_default()
+
+    print(f'{"mode":<5} {"audio s":>9} {"cpu s":>8} {"wall s":>8} {"streams/core":>13}')
+    for mode in args.modes:
+        result = run(mode, args.source, args.streams, args.seconds, args.volume)
+        print(f'{result["mode"]:<5} {result["audio_s"]:>9.1f} {result["cpu_s"]:>8.2f} {result["wall_s"]:>8.2f} {result["streams_per_core"]:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+WHITESPACE = re.compile(r'\s+')
+REPEATED = re.compile(r'(.)\1{2,}')
+
+
+def normalize(text: str):
+    # '  ㅋㅋㅋㅋㅋ ' and 'ㅋㅋㅋ' share a key, as do 'Hello' and 'hello'
+    text = WHITESPACE.sub(' ', text).strip().casefold()
+    return REPEATED.sub(r'\1\1', text)
+
+
+class PredictionCache:
+    def __init__(self, max_size: int = 10000, ttl_s: float = 600, version: Hashable = None):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.version = version
+        self.entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, text: str):
+        key = normalize(text)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, text: str, value: Any, version: Hashable = None):
+        key = normalize(text)
+        with self.lock:
+            # an answer computed by weights that were swapped out in the meantime must not be cached
+            if version != self.version:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl_s, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def set_version(self, version: Hashable):
+        with self.lock:
+            if version != self.version:
+                self.version = version
+                self.entries.clear()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
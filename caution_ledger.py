@@ -0,0 +1,86 @@
+import sqlite3
+import threading
+import time
+
+
+class CautionLedger:
+    def __init__(self, path: str):
+        self.path = path
+        self.connection: sqlite3.Connection = None
+        self.lock = threading.RLock()
+
+    def connect(self):
+        # opened on first use, like the song cache
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.executescript('''
+                CREATE TABLE IF NOT EXISTS cautions (
+                    id INTEGER PRIMARY KEY,
+                    guild_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    moderator_id INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS cautions_member ON cautions (guild_id, user_id, created_at);
+                DROP INDEX IF EXISTS cautions_recent;
+                CREATE INDEX IF NOT EXISTS cautions_window ON cautions (guild_id, created_at, user_id);
+                CREATE TABLE IF NOT EXISTS caution_totals (
+                    guild_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    last_at REAL NOT NULL,
+                    PRIMARY KEY (guild_id, user_id)
+                );
+                CREATE INDEX IF NOT EXISTS caution_totals_rank ON caution_totals (guild_id, count DESC, last_at DESC);
+            ''')
+        return self.connection
+
+    def add(self, guild_id: int, user_id: int, moderator_id: int):
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('BEGIN')
+                connection.execute('INSERT INTO cautions (guild_id, user_id, moderator_id, created_at) VALUES (?, ?, ?, ?)', (guild_id, user_id, moderator_id, now))
+                connection.execute('''
+                    INSERT INTO caution_totals (guild_id, user_id, count, last_at) VALUES (?, ?, 1, ?)
+                    ON CONFLICT (guild_id, user_id) DO UPDATE SET count = count + 1, last_at = excluded.last_at
+                ''', (guild_id, user_id, now))
+
+    def get_count(self, guild_id: int, user_id: int, since: float = None):
+        with self.lock:
+            connection = self.connect()
+            if since is None:
+                row = connection.execute('SELECT count FROM caution_totals WHERE guild_id = ? AND user_id = ?', (guild_id, user_id)).fetchone()
+                return row[0] if row is not None else 0
+            return connection.execute('SELECT COUNT(*) FROM cautions WHERE guild_id = ? AND user_id = ? AND created_at >= ?', (guild_id, user_id, since)).fetchone()[0]
+
+    def get_leaderboard(self, guild_id: int, limit: int = 10, offset: int = 0, since: float = None):
+        # the all-time ranking is read straight off the totals index, a window only reads the cautions inside it
+        with self.lock:
+            connection = self.connect()
+            if since is None:
+                return connection.execute(
+                    'SELECT user_id, count FROM caution_totals WHERE guild_id = ? ORDER BY count DESC, last_at DESC LIMIT ? OFFSET ?',
+                    (guild_id, limit, offset),
+                ).fetchall()
+            return connection.execute(
+                'SELECT user_id, COUNT(*) AS count FROM cautions INDEXED BY cautions_window WHERE guild_id = ? AND created_at >= ? GROUP BY user_id ORDER BY count DESC, MAX(created_at) DESC LIMIT ? OFFSET ?',
+                (guild_id, since, limit, offset),
+            ).fetchall()
+
+    def count_members(self, guild_id: int, since: float = None):
+        with self.lock:
+            connection = self.connect()
+            if since is None:
+                return connection.execute('SELECT COUNT(*) FROM caution_totals WHERE guild_id = ?', (guild_id,)).fetchone()[0]
+            return connection.execute('SELECT COUNT(DISTINCT user_id) FROM cautions INDEXED BY cautions_window WHERE guild_id = ? AND created_at >= ?', (guild_id, since)).fetchone()[0]
+
+    def get_history(self, guild_id: int, user_id: int, limit: int = 5):
+        with self.lock:
+            return self.connect().execute(
+                'SELECT moderator_id, created_at FROM cautions WHERE guild_id = ? AND user_id = ? ORDER BY created_at DESC LIMIT ?',
+                (guild_id, user_id, limit),
+            ).fetchall()
@@ -0,0 +1,74 @@
+from contextlib import nullcontext
+
+import torch
+from transformers import AutoTokenizer, ElectraForSequenceClassification
+
+
+BACKENDS = ('torch-eager', 'onnx-fp32', 'onnx-int8')
+NUM_LABELS = 4
+
+
+def load_dataset(csv_file: str):
+    import pandas as pd
+
+    # same cleaning as DiscordCmdDataset in train.ipynb, labels in the csv are 1-based
+    dataset = pd.read_csv(csv_file, sep=',').dropna(axis=0)
+    dataset.drop_duplicates(subset=['sentence'], inplace=True)
+    texts = dataset.iloc[:, 0].astype(str).tolist()
+    labels = (dataset.iloc[:, 1] - 1).astype(int).tolist()
+    return texts, labels
+
+
+def load_tokenizer(model_name: str):
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+def load_torch_model(model_name: str, weights_path: str, device: torch.device):
+    model = ElectraForSequenceClassification.from_pretrained(model_name, num_labels=NUM_LABELS)
+    model.to(device)
+    model.load_state_dict(torch.load(weights_path, map_location=device))
+    model.eval()
+    return model
+
+
+class TorchBackend:
+    def __init__(self, model: torch.nn.Module, device: torch.device):
+        self.model = model
+        self.device = device
+
+    def __call__(self, input_ids: torch.Tensor, attention_mask: torch.Tensor):
+        with torch.inference_mode():
+            return self.model(input_ids=input_ids.to(self.device), attention_mask=attention_mask.to(self.device)).logits
+
+
+class OnnxBackend:
+    def __init__(self, onnx_path: str):
+        import onnxruntime
+
+        self.session = onnxruntime.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+
+    def __call__(self, input_ids: torch.Tensor, attention_mask: torch.Tensor):
+        logits, = self.session.run(['logits'], {'input_ids': input_ids.numpy(), 'attention_mask': attention_mask.numpy()})
+        return torch.from_numpy(logits)
+
+
+def load_backend(name: str, model_name: str, weights_path: str, onnx_path: str, onnx_int8_path: str, device: torch.device):
+    if name == 'torch-eager':
+        return TorchBackend(load_torch_model(model_name, weights_path, device), device)
+    elif name == 'onnx-fp32':
+        return OnnxBackend(onnx_path)
+    elif name == 'onnx-int8':
+        return OnnxBackend(onnx_int8_path)
+    else:
+        raise ValueError(f'unknown backend {name!r}, expected one of {BACKENDS}')
+
+
+def predict_batch(tokenizer, backend, texts: list[str], timings=None):
+    # padding=True pads the batch to its longest member, the attention mask keeps the answers per text unchanged
+    with timings.measure('tokenize') if timings is not None else nullcontext():
+        inputs = tokenizer(texts, return_tensors='pt', padding=True, truncation=True)
+    with timings.measure('forward') if timings is not None else nullcontext():
+        logits = backend(inputs['input_ids'], inputs['attention_mask'])
+    predicted_classes = torch.argmax(logits, dim=1)
+    predicted_probs = torch.softmax(logits, dim=1).gather(1, predicted_classes.unsqueeze(1)).squeeze(1)
+    return list(zip(predicted_classes.tolist(), predicted_probs.tolist()))
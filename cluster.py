@@ -0,0 +1,247 @@
+import asyncio
+import inspect
+import itertools
+import multiprocessing
+import threading
+import time
+from multiprocessing.connection import Connection, wait
+
+import aiohttp
+
+
+HEALTH_INTERVAL_S = 10
+HEALTH_TIMEOUT_S = 60
+READY_TIMEOUT_S = 180
+QUERY_TIMEOUT_S = 5
+
+
+def fetch_shard_count(token: str):
+    async def fetch():
+        async with aiohttp.ClientSession() as session:
+            async with session.get('https://discord.com/api/v10/gateway/bot', headers={'Authorization': f'Bot {token}'}) as response:
+                response.raise_for_status()
+                return (await response.json())['shards']
+
+    return asyncio.run(fetch())
+
+
+def split_shards(shard_count: int, cluster_count: int):
+    # contiguous ranges, the first clusters take one extra shard when the split is uneven
+    cluster_count = min(cluster_count, shard_count)
+    size, extra = divmod(shard_count, cluster_count)
+    ranges = []
+    start = 0
+    for i in range(cluster_count):
+        end = start + size + (i < extra)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class ClusterClient:
+    def __init__(self, cluster_id: int, connection: Connection):
+        self.cluster_id = cluster_id
+        self.connection = connection
+        self.lock = threading.Lock()
+        self.handlers: dict[str, callable] = {}
+        self.futures: dict[int, asyncio.Future] = {}
+        self.nonces = itertools.count()
+        self.loop: asyncio.AbstractEventLoop = None
+        self.heartbeat_task: asyncio.Task = None
+
+    def register(self, name: str, handler: callable):
+        self.handlers[name] = handler
+
+    def start(self, bot):
+        self.loop = asyncio.get_running_loop()
+        # the pipe is read on its own thread, so a slow launcher never blocks the gateway loop
+        threading.Thread(target=self.read, name=f'cluster-{self.cluster_id}-ipc', daemon=True).start()
+        self.heartbeat_task = asyncio.create_task(self.heartbeat(bot))
+
+    def read(self):
+        while True:
+            try:
+                message = self.connection.recv()
+            except (EOFError, OSError):
+                return
+            self.loop.call_soon_threadsafe(self.dispatch, message)
+
+    def dispatch(self, message: dict):
+        if message['op'] == 'query':
+            asyncio.create_task(self.answer(message))
+        elif message['op'] == 'result':
+            future = self.futures.pop(message['nonce'], None)
+            if future is not None and not future.done():
+                future.set_result(message['values'])
+
+    async def answer(self, message: dict):
+        value = None
+        handler = self.handlers.get(message['name'])
+        if handler is not None:
+            try:
+                value = handler(*message['args'])
+                if inspect.isawaitable(value):
+                    value = await value
+            except Exception as e:
+                print(f'[ClusterClient] {message["name"]}: {e!r}')
+                value = None
+        self.send({'op': 'reply', 'nonce': message['nonce'], 'value': value})
+
+    async def query(self, name: str, *args, timeout_s: float = QUERY_TIMEOUT_S):
+        # answered by every cluster, 'health' is answered by the launcher from the latest heartbeats
+        nonce = next(self.nonces)
+        future = self.loop.create_future()
+        self.futures[nonce] = future
+        self.send({'op': 'query', 'nonce': nonce, 'name': name, 'args': args})
+        try:
+            return await asyncio.wait_for(future, timeout_s)
+        except asyncio.TimeoutError:
+            self.futures.pop(nonce, None)
+            return []
+
+    def send(self, message: dict):
+        with self.lock:
+            self.connection.send(message)
+
+    async def heartbeat(self, bot):
+        await bot.wait_until_ready()
+        self.send({'op': 'ready'})
+        while True:
+            self.send({
+                'op': 'health',
+                'guilds': len(bot.guilds),
+                'voice': len(bot.voice_clients),
+                'latency': bot.latency,
+                'shards': dict(bot.latencies),
+            })
+            await asyncio.sleep(HEALTH_INTERVAL_S)
+
+    def close(self):
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+        self.connection.close()
+
+
+class ClusterLauncher:
+    def __init__(self, target: callable, shard_ranges: list[list[int]], shard_count: int):
+        self.target = target
+        self.shard_ranges = shard_ranges
+        self.shard_count = shard_count
+        self.context = multiprocessing.get_context('spawn')
+        self.clusters: dict[int, tuple[multiprocessing.Process, Connection]] = {}
+        self.health: dict[int, dict] = {}
+        self.pending: dict[tuple[int, int], tuple[set[int], dict[int, object]]] = {}
+
+    def start_cluster(self, cluster_id: int):
+        connection, child_connection = self.context.Pipe()
+        process = self.context.Process(
+            target=self.target,
+            args=(cluster_id, self.shard_ranges[cluster_id], self.shard_count, len(self.shard_ranges), child_connection),
+            name=f'cluster-{cluster_id}',
+        )
+        process.start()
+        child_connection.close()
+        self.clusters[cluster_id] = (process, connection)
+        self.health[cluster_id] = {'started_at': time.time()}
+        print(f'[ClusterLauncher] cluster {cluster_id} started with shards {self.shard_ranges[cluster_id]} (pid {process.pid})')
+
+    def wait_ready(self, cluster_id: int):
+        # clusters are started one at a time, so that their shards do not identify at the same time
+        connection = self.clusters[cluster_id][1]
+        deadline = time.time() + READY_TIMEOUT_S
+        while (remaining := deadline - time.time()) > 0:
+            if not connection.poll(remaining):
+                break
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                break
+            self.handle(cluster_id, message)
+            if message['op'] == 'ready':
+                return
+        print(f'[ClusterLauncher] cluster {cluster_id} did not become ready')
+
+    def run(self):
+        for cluster_id in range(len(self.shard_ranges)):
+            self.start_cluster(cluster_id)
+            self.wait_ready(cluster_id)
+        try:
+            while True:
+                self.poll()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def poll(self):
+        connections = {connection: cluster_id for cluster_id, (_, connection) in self.clusters.items()}
+        for connection in wait(list(connections), timeout=HEALTH_INTERVAL_S):
+            cluster_id = connections[connection]
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                self.restart(cluster_id, 'exited')
+                continue
+            self.handle(cluster_id, message)
+
+        now = time.time()
+        for cluster_id, health in list(self.health.items()):
+            last_seen = health.get('received_at', health['started_at'] + READY_TIMEOUT_S)
+            if now - last_seen > HEALTH_TIMEOUT_S:
+                self.restart(cluster_id, 'stopped sending health')
+
+    def handle(self, cluster_id: int, message: dict):
+        op = message['op']
+        if op == 'health':
+            self.health[cluster_id] = {**message, 'started_at': self.health[cluster_id]['started_at'], 'received_at': time.time()}
+        elif op == 'ready':
+            print(f'[ClusterLauncher] cluster {cluster_id} ready')
+        elif op == 'query':
+            if message['name'] == 'health':
+                values = [{'cluster': id, **health} for id, health in sorted(self.health.items())]
+                self.send(cluster_id, {'op': 'result', 'nonce': message['nonce'], 'values': values})
+                return
+            key = (cluster_id, message['nonce'])
+            self.pending[key] = (set(self.clusters), {})
+            for id in list(self.clusters):
+                self.send(id, {**message, 'nonce': key})
+        elif op == 'reply':
+            entry = self.pending.get(message['nonce'])
+            if entry is not None:
+                entry[0].discard(cluster_id)
+                entry[1][cluster_id] = message['value']
+                self.finish_if_answered(message['nonce'])
+
+    def finish_if_answered(self, key: tuple[int, int]):
+        waiting, values = self.pending[key]
+        if not waiting:
+            del self.pending[key]
+            origin, nonce = key
+            self.send(origin, {'op': 'result', 'nonce': nonce, 'values': [value for _, value in sorted(values.items())]})
+
+    def send(self, cluster_id: int, message: dict):
+        try:
+            self.clusters[cluster_id][1].send(message)
+        except (OSError, KeyError):
+            pass
+
+    def restart(self, cluster_id: int, reason: str):
+        print(f'[ClusterLauncher] cluster {cluster_id} {reason}, restarting')
+        process, connection = self.clusters.pop(cluster_id)
+        connection.close()
+        if process.is_alive():
+            process.terminate()
+        process.join(10)
+        # queries waiting on the cluster are answered by the others
+        for key in list(self.pending):
+            self.pending[key][0].discard(cluster_id)
+            self.finish_if_answered(key)
+        self.start_cluster(cluster_id)
+
+    def stop(self):
+        for process, connection in self.clusters.values():
+            connection.close()
+            if process.is_alive():
+                process.terminate()
+        for process, _ in self.clusters.values():
+            process.join(10)
@@ -1,40 +1,137 @@
+import asyncio
+import os
+import statistics
+import time
+from collections import deque
+
 import aiohttp
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 
+import local_inference
+from prefilter import Prefilter
+
+
+# Messages the prefilter scores below the threshold for PREFILTER_RECALL are answered as 'None' without asking the server
+PREFILTER_PATH = 'prefilter.npz'
+PREFILTER_RECALL = 0.99
+
+# A message that has no label within LABEL_TIMEOUT_S (including the wait for a free slot) is treated as 'None'
+INFERENCE_URL = 'http://www.example.com'
+LABEL_TIMEOUT_S = 1.5
+MAX_IN_FLIGHT = 32
+KEEPALIVE_TIMEOUT_S = 60
+# Same cut-off as main.py, the local backend answers 'None' below it
+CONFIDENCE_THRESHOLD = 0.25
+
 
 @app_commands.guild_only()
 class NLP(commands.GroupCog, name='자연어처리'):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.label_dict = {0: 'None', 1: '봇이랑 가위바위보를 해요', 2: '주사위를 던져요', 3: '노래 관련 기능을 사용해요', 4: '경고를 줄 멤버를 선택해요'}
+        self.prefilter: Prefilter = None
+        if os.path.exists(PREFILTER_PATH):
+            self.prefilter = Prefilter.load(PREFILTER_PATH, PREFILTER_RECALL)
+        else:
+            print(f'[NLP] {PREFILTER_PATH} not found, every message goes to the server')
+        self.forwarded = 0
+        self.short_circuited = 0
+        self.failed = 0
+        self.session: aiohttp.ClientSession = None
+        self.semaphore = asyncio.Semaphore(MAX_IN_FLIGHT)
+        self.in_flight: dict[str, asyncio.Task] = {}
+        self.latencies: deque[float] = deque(maxlen=1000)
+
+    async def cog_load(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=MAX_IN_FLIGHT, keepalive_timeout=KEEPALIVE_TIMEOUT_S),
+            timeout=aiohttp.ClientTimeout(total=LABEL_TIMEOUT_S),
+        )
+
+    async def cog_unload(self):
+        await self.session.close()
 
     @commands.GroupCog.listener()
     async def on_message(self, message: discord.Message):
-        if self.bot.data[message.guild.id]['NLP']:
+        if self.bot.data[message.guild.id].nlp:
             if not message.author.bot:
+                if self.prefilter is not None and self.prefilter.is_none(message.content):
+                    self.short_circuited += 1
+                    return
+                self.forwarded += 1
                 label = await self.get_label(message.content)
                 if label != 0:
-                    await message.reply(self.label_dict[label])
+                    # the cog that owns the label answers the message itself, with its UI as the only reply
+                    await self.bot.intent_bus.publish(label, message)
     
     async def get_label(self, message_content: str):
-        url = 'http://www.example.com?message='
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url + message_content) as response:
-                return int(response)
+        # identical messages sent while a request is running share its answer
+        task = self.in_flight.get(message_content)
+        if task is None:
+            task = asyncio.create_task(self.timed_label(message_content))
+            self.in_flight[message_content] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(message_content, None))
+        return await asyncio.shield(task)
+
+    async def timed_label(self, message_content: str):
+        start = time.perf_counter()
+        if self.bot.nlp_pool is not None:
+            label = await self.local_label(message_content)
+        else:
+            label = await self.request_label(message_content)
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        return label
+
+    async def local_label(self, message_content: str):
+        try:
+            async with asyncio.timeout(LABEL_TIMEOUT_S):
+                label, prob = await self.bot.loop.run_in_executor(self.bot.nlp_pool, local_inference.predict_sentiment, message_content)
+        except Exception as e:
+            self.failed += 1
+            print(f'[local_label] {e!r}')
+            return 0
+
+        return label if prob >= CONFIDENCE_THRESHOLD else 0
+
+    async def request_label(self, message_content: str):
+        try:
+            async with asyncio.timeout(LABEL_TIMEOUT_S):
+                async with self.semaphore:
+                    async with self.session.get(INFERENCE_URL, params={'message': message_content}) as response:
+                        response.raise_for_status()
+                        text = await response.text()
+        except (aiohttp.ClientError, TimeoutError) as e:
+            self.failed += 1
+            print(f'[get_label] {e!r}')
+            return 0
+
+        # the server answers with generated text instead of a label when it is not confident
+        return int(text) if text.isdigit() else 0
 
     @app_commands.command(name='켜기', description='자연어 처리 기능을 켜요')
     async def turn_on(self, interaction: discord.Interaction):
-        self.bot.data[interaction.guild_id]['NLP'] = True
+        self.bot.data[interaction.guild_id].nlp = True
         await interaction.response.send_message('자연어 처리 기능을 켰어요')
 
     @app_commands.command(name='끄기', description='자연어 처리 기능을 꺼요')
     async def turn_off(self, interaction: discord.Interaction):
-        self.bot.data[interaction.guild_id]['NLP'] = False
+        self.bot.data[interaction.guild_id].nlp = False
         await interaction.response.send_message('자연어 처리 기능을 껐어요')
 
+    @app_commands.command(name='통계', description='서버로 보낸 메시지와 걸러낸 메시지 수를 보여줘요')
+    async def show_stats(self, interaction: discord.Interaction):
+        total = self.forwarded + self.short_circuited
+        ratio = self.short_circuited / total * 100 if total else 0
+        content = f'서버로 보낸 메시지 {self.forwarded}개(실패 {self.failed}개), 걸러낸 메시지 {self.short_circuited}개 ({ratio:.1f}%)'
+        content += f'\n전달한 명령 {self.bot.intent_bus.published}개, 처리할 곳이 없는 명령 {self.bot.intent_bus.unhandled}개'
+        if len(self.latencies) > 1:
+            quantiles = statistics.quantiles(self.latencies, n=100, method='inclusive')
+            backend = 'local' if self.bot.nlp_pool is not None else 'remote'
+            content += f'\n{backend} 응답 시간 p50 {quantiles[49]:.1f}ms, p95 {quantiles[94]:.1f}ms'
+        await interaction.response.send_message(content)
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(NLP(bot))
\ No newline at end of file
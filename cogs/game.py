@@ -4,6 +4,8 @@ import random
 import discord
 from discord import app_commands
 from discord.ext import commands
+
+import intent_bus
         
 
 class RPS():
@@ -17,12 +19,11 @@ class RPS():
         self.result_dict = {0: '🤔 비겼어요', 1: '🤣 이겼어요!', 2: '😵‍💫 졌어요..'}
 
     @classmethod
-    async def from_message(cls, message: discord.Message, bot: commands.Bot):
+    async def from_message(cls, trigger_msg: discord.Message, bot: commands.Bot):
         rps = cls()
         rps.bot = bot
-        trigger_msg = await message.channel.fetch_message(message.reference.message_id)
         rps.author = trigger_msg.author
-        rps.sent_msg = await message.edit(content=None, embed=rps.get_embed())
+        rps.sent_msg = await trigger_msg.reply(embed=rps.get_embed())
         rps.add_reactions()
         await rps.wait_for_reaction()
     
@@ -96,12 +97,11 @@ class Dice(discord.ui.View):
         self.add_item(button)
 
     @classmethod
-    async def from_message(cls, message: discord.Message, bot: commands.Bot):
+    async def from_message(cls, trigger_msg: discord.Message, bot: commands.Bot):
         dice = cls()
         dice.bot = bot
-        trigger_msg = await message.channel.fetch_message(message.reference.message_id)
         dice.author = trigger_msg.author
-        dice.sent_msg = await message.edit(content=None, embed=dice.get_embed(), view=dice.get_view())
+        dice.sent_msg = await trigger_msg.reply(embed=dice.get_embed(), view=dice.get_view())
     
     @classmethod
     async def from_interaction(cls, interaction: discord.Interaction, bot: commands.Bot):
@@ -166,13 +166,19 @@ class Game(commands.GroupCog, name='게임'):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
-    @commands.GroupCog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author == self.bot.user:
-            if message.content == '봇이랑 가위바위보를 해요':
-                await RPS.from_message(message, self.bot)
-            elif message.content == '주사위를 던져요':
-                await Dice.from_message(message, self.bot)
+    async def cog_load(self):
+        self.bot.intent_bus.subscribe(intent_bus.RPS, self.on_rps_intent)
+        self.bot.intent_bus.subscribe(intent_bus.DICE, self.on_dice_intent)
+
+    async def cog_unload(self):
+        self.bot.intent_bus.unsubscribe(intent_bus.RPS, self.on_rps_intent)
+        self.bot.intent_bus.unsubscribe(intent_bus.DICE, self.on_dice_intent)
+
+    async def on_rps_intent(self, trigger_msg: discord.Message):
+        await RPS.from_message(trigger_msg, self.bot)
+
+    async def on_dice_intent(self, trigger_msg: discord.Message):
+        await Dice.from_message(trigger_msg, self.bot)
 
     @app_commands.command(name='가위바위보', description='봇이랑 가위바위보를 해요')
     async def play_rps(self, interaction: discord.Interaction):
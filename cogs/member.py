@@ -1,62 +1,102 @@
 import asyncio
+import time
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 
+import intent_bus
+from guild_state import GuildState
+
+
+# Members per page of the caution list
+CAUTION_PAGE_SIZE = 10
+# Default window of the caution list in days, None counts every caution ever given
+CAUTION_WINDOW_DAYS = None
+
 
 class Caution(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)
         self.bot: commands.Bot = None
         self.author: discord.Member = None
-        self.data: dict[str, bool | int | float | list[dict[str, str]] | dict[discord.Member, int] | dict[str, discord.Message]] = None
+        self.data: GuildState = None
+        self.page = 0
+        self.window_days: int = CAUTION_WINDOW_DAYS
+        self.selected_id: int = None
         user_select = discord.ui.UserSelect(placeholder='경고를 줄 멤버를 선택해요', row=0)
         user_select.callback = self.callback
         self.add_item(user_select)
 
+        prev_page_btn = discord.ui.Button(emoji='◀️', row=1)
+        prev_page_btn.callback = self.prev_page_btn_callback
+        self.add_item(prev_page_btn)
+
+        next_page_btn = discord.ui.Button(emoji='▶️', row=1)
+        next_page_btn.callback = self.next_page_btn_callback
+        self.add_item(next_page_btn)
+
     @classmethod
-    async def from_message(cls, message: discord.Message, bot: commands.Bot):
+    async def from_message(cls, trigger_msg: discord.Message, bot: commands.Bot):
         caution = cls()
         caution.bot = bot
-        trigger_msg = await message.channel.fetch_message(message.reference.message_id)
         caution.author = trigger_msg.author
-        caution.data = bot.data[message.guild.id]
+        caution.data = bot.data[trigger_msg.guild.id]
         caution.delete_sent_msg()
-        caution.data['sent_msg']['Caution'] = await message.edit(content=None, embed=caution.get_embed(), view=caution)
+        caution.data.sent_msg['Caution'] = await trigger_msg.reply(embed=caution.get_embed(), view=caution)
     
     @classmethod
-    async def from_interaction(cls, interaction: discord.Interaction, bot: commands.Bot):
+    async def from_interaction(cls, interaction: discord.Interaction, bot: commands.Bot, window_days: int = CAUTION_WINDOW_DAYS):
         caution = cls()
         caution.bot = bot
+        caution.window_days = window_days
         caution.author = interaction.user
         caution.data = bot.data[interaction.guild_id]
         caution.delete_sent_msg()
-        caution.data['sent_msg']['Caution'] = await interaction.edit_original_response(embed=caution.get_embed(), view=caution)
+        caution.data.sent_msg['Caution'] = await interaction.edit_original_response(embed=caution.get_embed(), view=caution)
 
     def delete_sent_msg(self):
-        if 'Caution' in self.data['sent_msg']:
-            asyncio.run_coroutine_threadsafe(self.data['sent_msg']['Caution'].delete(), self.bot.loop)
-            del self.data['sent_msg']['Caution']
+        if 'Caution' in self.data.sent_msg:
+            asyncio.run_coroutine_threadsafe(self.data.sent_msg['Caution'].delete(), self.bot.loop)
+            del self.data.sent_msg['Caution']
     
+    def get_since(self):
+        return time.time() - self.window_days * 24 * 60 * 60 if self.window_days is not None else None
+
+    def get_page_count(self):
+        return max((self.bot.cautions.count_members(self.data.guild_id, self.get_since()) - 1) // CAUTION_PAGE_SIZE + 1, 1)
+
     def get_embed(self):
         embed = discord.Embed(color=discord.Color.blurple(), title='⚠️  경고')
         embed.set_thumbnail(url=self.author.display_avatar.url)
         embed.add_field(name='', value='', inline=False)
         embed.set_footer(text=self.author, icon_url=self.author.display_avatar.url)
 
-        caution_dict = self.data['caution_dict']
-        if caution_dict:
+        # only the rows of the shown page are read, however many members have ever been warned
+        page_count = self.get_page_count()
+        self.page = min(self.page, page_count - 1)
+        leaderboard = self.bot.cautions.get_leaderboard(self.data.guild_id, CAUTION_PAGE_SIZE, self.page * CAUTION_PAGE_SIZE, self.get_since())
+        if leaderboard:
             embed.description = '경고를 받은 멤버목록이에요\n\n쫓겨나지 않게 조심해야 해요'
-            for member, count in caution_dict.items():
-                embed.add_field(
-                    name=f'{member.display_name}({member})',
-                    value=f'경고 {count}회',
-                    inline=False,
-                )
+            embed.add_field(
+                name=f'최근 {self.window_days}일 목록 {self.page + 1}/{page_count}' if self.window_days is not None else f'목록 {self.page + 1}/{page_count}',
+                value='\n'.join(f'{self.page * CAUTION_PAGE_SIZE + i + 1}. <@{user_id}> 경고 {count}회' for i, (user_id, count) in enumerate(leaderboard)),
+                inline=False,
+            )
         else:
             embed.description = '경고받은 멤버가 없어요\n\n심심한 곳이네요'
 
+        if self.selected_id is not None:
+            history = self.bot.cautions.get_history(self.data.guild_id, self.selected_id)
+            embed.add_field(
+                name='최근 경고',
+                value='\n'.join(f'<t:{int(created_at)}:R> <@{moderator_id}>' for moderator_id, created_at in history),
+                inline=False,
+            )
+
+        self.children[1].disabled = self.page == 0
+        self.children[2].disabled = self.page == page_count - 1
+
         return embed
     
     async def callback(self, interaction: discord.Interaction):
@@ -64,13 +104,20 @@ class Caution(discord.ui.View):
         self.author = interaction.user
 
         member = self.children[0].values[0]
-        caution_dict = self.data['caution_dict']
-        if member in caution_dict:
-            caution_dict[member] += 1
-        else:
-            caution_dict[member] = 1
+        self.bot.cautions.add(self.data.guild_id, member.id, interaction.user.id)
+        self.selected_id = member.id
+
+        await self.data.sent_msg['Caution'].edit(embed=self.get_embed(), view=self)
+
+    async def prev_page_btn_callback(self, interaction: discord.Interaction):
+        asyncio.run_coroutine_threadsafe(interaction.response.defer(), self.bot.loop)
+        self.page = max(self.page - 1, 0)
+        await self.data.sent_msg['Caution'].edit(embed=self.get_embed(), view=self)
 
-        await self.data['sent_msg']['Caution'].edit(embed=self.get_embed(), view=self)
+    async def next_page_btn_callback(self, interaction: discord.Interaction):
+        asyncio.run_coroutine_threadsafe(interaction.response.defer(), self.bot.loop)
+        self.page += 1
+        await self.data.sent_msg['Caution'].edit(embed=self.get_embed(), view=self)
 
 
 @app_commands.guild_only()
@@ -78,15 +125,21 @@ class Member(commands.GroupCog, name='멤버'):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
-    @commands.GroupCog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author == self.bot.user and message.content == '경고를 줄 멤버를 선택해요':
-            await Caution.from_message(message, self.bot)
+    async def cog_load(self):
+        self.bot.intent_bus.subscribe(intent_bus.CAUTION, self.on_caution_intent)
+
+    async def cog_unload(self):
+        self.bot.intent_bus.unsubscribe(intent_bus.CAUTION, self.on_caution_intent)
+
+    async def on_caution_intent(self, trigger_msg: discord.Message):
+        await Caution.from_message(trigger_msg, self.bot)
 
     @app_commands.command(name='경고', description='경고를 줄 멤버를 선택해요')
-    async def caution(self, interaction: discord.Interaction):
+    @app_commands.rename(window_days='기간')
+    @app_commands.describe(window_days='최근 며칠 동안의 경고만 세요, 비워두면 모든 경고를 세요')
+    async def caution(self, interaction: discord.Interaction, window_days: app_commands.Range[int, 1, 3650] = None):
         await interaction.response.defer(thinking=True)
-        await Caution.from_interaction(interaction, self.bot)
+        await Caution.from_interaction(interaction, self.bot, window_days if window_days is not None else CAUTION_WINDOW_DAYS)
 
 
 async def setup(bot: commands.Bot):
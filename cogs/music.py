@@ -5,7 +5,68 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
-import yt_dlp
+import intent_bus
+from guild_state import GuildState
+from song_cache import Song, SongCache
+from track_queue import Track
+
+
+# The next track's stream URL is resolved as soon as the current one starts and its FFmpeg input is opened PREFETCH_LEAD_S before the end
+PREFETCH_LEAD_S = 15
+# Playlist imports resolve this many songs at once
+PLAYLIST_IMPORT_CONCURRENCY = 4
+# 'opus' lets FFmpeg apply the volume and encode Opus itself, 'pcm' scales PCM in Python and lets discord.py encode it
+PLAYBACK_MODE = 'opus'
+OPUS_BITRATE = 128
+
+
+class TrackedAudio(discord.AudioSource):
+    # counts the 20ms frames handed to the voice player, so playback can be restarted where it was
+    def __init__(self, audio: discord.AudioSource, offset: float = 0):
+        self.audio = audio
+        self.offset = offset
+        self.frames = 0
+
+    @property
+    def position(self):
+        return self.offset + self.frames * discord.opus.Encoder.FRAME_LENGTH / 1000
+
+    def read(self):
+        data = self.audio.read()
+        if data:
+            self.frames += 1
+        return data
+
+    def is_opus(self):
+        return self.audio.is_opus()
+
+    def cleanup(self):
+        self.audio.cleanup()
+
+
+def create_audio(source: str, volume: float, position: float = 0, mode: str = PLAYBACK_MODE):
+    # files from the audio cache are local and need no reconnect options
+    before_options = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5' if source.startswith('http') else ''
+    if position:
+        before_options += f' -ss {position:.2f}'
+
+    if mode == 'opus':
+        audio = discord.FFmpegOpusAudio(
+            source,
+            bitrate=OPUS_BITRATE,
+            before_options=before_options,
+            options=f'-vn -filter:a volume={volume}',
+        )
+    else:
+        audio = discord.PCMVolumeTransformer(
+            discord.FFmpegPCMAudio(
+                source,
+                before_options=before_options,
+                options='-vn',
+            ),
+            volume,
+        )
+    return TrackedAudio(audio, position)
 
 
 class MusicPlayer(discord.ui.View):
@@ -13,25 +74,13 @@ class MusicPlayer(discord.ui.View):
         super().__init__(timeout=None)
         self.bot: commands.Bot = None
         self.author: discord.Member = None
-        self.data: dict[str, bool | int | float | list[dict[str, str]] | dict[discord.Member, int] | dict[str, discord.Message]] = None
-        self.history: dict[str, dict[str, str]] = None
+        self.data: GuildState = None
+        self.history: SongCache = None
         self.guild: discord.Guild = None
         self.channel: discord.TextChannel = None
         self.batch_size = 10
         self.repeat_dict = {0: '➡️', 1: '🔁', 2: '🔂'}
         self.index_dict = {'1️⃣': 0, '2️⃣': 1, '3️⃣': 2, '4️⃣': 3, '5️⃣': 4, '6️⃣': 5, '7️⃣': 6, '8️⃣': 7, '9️⃣': 8, '🔟': 9}
-        self.ytdlp = yt_dlp.YoutubeDL({
-            'format': 'bestaudio/best',
-            'nocheckcertificate': True,
-            'ignoreerrors': True,
-            'logtostderr': False,
-            'quiet': True,
-            'no_warnings': True,
-            'default_search': 'auto',
-            'source_address': '0.0.0.0',
-            'extract_flat': True,
-            'skip_download': True,
-        })
 
         play_btn = discord.ui.Button(row=0)
         play_btn.callback = self.play_btn_callback
@@ -53,18 +102,37 @@ class MusicPlayer(discord.ui.View):
         volume_btn.callback = self.volume_btn_callback
         self.add_item(volume_btn)
 
+        prev_page_btn = discord.ui.Button(emoji='◀️', row=1, custom_id='MusicPlayer:prev_page')
+        prev_page_btn.callback = self.prev_page_btn_callback
+        self.add_item(prev_page_btn)
+
+        next_page_btn = discord.ui.Button(emoji='▶️', row=1, custom_id='MusicPlayer:next_page')
+        next_page_btn.callback = self.next_page_btn_callback
+        self.add_item(next_page_btn)
+
+        shuffle_btn = discord.ui.Button(emoji='🔀', row=1)
+        shuffle_btn.callback = self.shuffle_btn_callback
+        self.add_item(shuffle_btn)
+
+        dedupe_btn = discord.ui.Button(emoji='🧹', row=1)
+        dedupe_btn.callback = self.dedupe_btn_callback
+        self.add_item(dedupe_btn)
+
+        edit_btn = discord.ui.Button(emoji='✂️', row=1)
+        edit_btn.callback = self.edit_btn_callback
+        self.add_item(edit_btn)
+
     @classmethod
-    async def from_message(cls, message: discord.Message, bot: commands.Bot):
+    async def from_message(cls, trigger_msg: discord.Message, bot: commands.Bot):
         music_player = cls()
         music_player.bot = bot
-        trigger_msg = await message.channel.fetch_message(message.reference.message_id)
         music_player.author = trigger_msg.author
-        music_player.data = bot.data[message.guild.id]
+        music_player.data = bot.data[trigger_msg.guild.id]
         music_player.history = bot.history
-        music_player.guild = message.guild
-        music_player.channel = message.channel
+        music_player.guild = trigger_msg.guild
+        music_player.channel = trigger_msg.channel
         music_player.delete_sent_msg()
-        music_player.data['sent_msg']['MusicPlayer'] = await message.edit(content=None, embed=music_player.get_embed(), view=music_player.get_view())
+        music_player.data.sent_msg['MusicPlayer'] = await trigger_msg.reply(embed=music_player.get_embed(), view=music_player.get_view())
     
     @classmethod
     async def from_sent_msg(cls, message: discord.Message, bot: commands.Bot):
@@ -75,7 +143,7 @@ class MusicPlayer(discord.ui.View):
         music_player.history = bot.history
         music_player.guild = message.guild
         music_player.channel = message.channel
-        asyncio.run_coroutine_threadsafe(message.edit(embed=music_player.get_embed(), view=music_player.get_view()), bot.loop)
+        music_player.render()
 
     @classmethod
     async def from_interaction(cls, interaction: discord.Interaction, bot: commands.Bot):
@@ -87,12 +155,20 @@ class MusicPlayer(discord.ui.View):
         music_player.guild = interaction.guild
         music_player.channel = interaction.channel
         music_player.delete_sent_msg()
-        music_player.data['sent_msg']['MusicPlayer'] = await interaction.edit_original_response(embed=music_player.get_embed(), view=music_player.get_view())
+        music_player.data.sent_msg['MusicPlayer'] = await interaction.edit_original_response(embed=music_player.get_embed(), view=music_player.get_view())
+        return music_player
+
+    def render(self):
+        self.data.render.request(self.bot.loop, self.edit_sent_msg)
+
+    async def edit_sent_msg(self):
+        if 'MusicPlayer' in self.data.sent_msg:
+            await self.data.sent_msg['MusicPlayer'].edit(content=self.data.import_progress, embed=self.get_embed(), view=self.get_view())
 
     def delete_sent_msg(self):
-        if 'MusicPlayer' in self.data['sent_msg']:
-            asyncio.run_coroutine_threadsafe(self.data['sent_msg']['MusicPlayer'].delete(), self.bot.loop)
-            del self.data['sent_msg']['MusicPlayer']
+        if 'MusicPlayer' in self.data.sent_msg:
+            asyncio.run_coroutine_threadsafe(self.data.sent_msg['MusicPlayer'].delete(), self.bot.loop)
+            del self.data.sent_msg['MusicPlayer']
     
     def get_embed(self):
         embed = discord.Embed(color=discord.Color.blurple())
@@ -108,25 +184,52 @@ class MusicPlayer(discord.ui.View):
                 embed.title = '⏹️  대기 중'
         else:
             embed.title = '⏹️  대기 중'
-        embed.title += f'  -  음량 {int(self.data['volume'] * 400)}%'
+        embed.title += f'  -  음량 {int(self.data.volume * 400)}%'
 
-        playlist = self.data['playlist']
+        playlist = self.data.playlist
         if playlist:
-            embed.description = f'[{playlist[0]['title']}]({playlist[0]['url']}) [{(playlist[0]['length'])}]\n\n{playlist[0]['artist'] if 'artist' in playlist[0] else ''}'
-            embed.set_thumbnail(url=playlist[0]['thumbnail'])
-
-            for i in range(0, len(playlist), self.batch_size):
-                embed.add_field(
-                    name='[Playlist]' if i == 0 else '',
-                    value='\n'.join([f'{i + j + 1}. [{song['title']}]({song['url']}) [{song['length']}]' for j, song in enumerate(playlist[i:min(i + self.batch_size, len(playlist))])]),
-                    inline=False,
-                )
+            song = playlist.head.song
+            embed.description = f'[{song.title}]({song.url}) [{song.length}]\n\n{song.artist or ''}'
+            embed.set_thumbnail(url=song.thumbnail)
+
+            page = self.get_page()
+            embed.add_field(
+                name=f'[Playlist]  {page + 1}/{self.get_page_count()}',
+                value=self.get_page_text(page),
+                inline=False,
+            )
         else:
             embed.description = '재생할 수 있는 노래가 없어요 :(\n\n플레이리스트에 노래를 넣어야 해요'
             embed.set_thumbnail(url=self.author.display_avatar.url)
             embed.add_field(name='[Playlist]', value='비어있어요...', inline=False)
 
         return embed
+
+    def get_page_count(self):
+        return max((len(self.data.playlist) + self.batch_size - 1) // self.batch_size, 1)
+
+    def get_page(self):
+        # the queue may have shrunk since the page was chosen
+        self.data.page = min(self.data.page, self.get_page_count() - 1)
+        return self.data.page
+
+    def get_page_text(self, page: int):
+        # an unchanged queue returns the cached text, after a track change the page is sliced out of the queue's list copy
+        version = self.data.playlist.version
+        cached = self.data.page_cache.get(page)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        start = page * self.batch_size
+        songs = [track.song for track in self.data.playlist.slice(start, start + self.batch_size)]
+
+        text = '\n'.join(f'{start + i + 1}. [{song.title}]({song.url}) [{song.length}]' for i, song in enumerate(songs))
+        if len(text) > 1024:
+            # an embed field holds at most 1024 characters, long titles lose their links and are shortened
+            title_length = 1024 // len(songs) - 20
+            text = '\n'.join(f'{start + i + 1}. {song.title[:title_length]} [{song.length}]' for i, song in enumerate(songs))
+        self.data.page_cache[page] = (version, text)
+        return text
     
     def get_view(self):
         play_btn = self.children[0]
@@ -136,9 +239,9 @@ class MusicPlayer(discord.ui.View):
             play_btn.emoji = '▶️'
 
         repeat_btn = self.children[2]
-        repeat_btn.emoji = self.repeat_dict[self.data['repeat']]
+        repeat_btn.emoji = self.repeat_dict[self.data.repeat]
 
-        volume = self.data['volume']
+        volume = self.data.volume
         volume_btn = self.children[4]
         if volume > 0.5:
             print('[get_view] volume > 0.5')
@@ -151,30 +254,64 @@ class MusicPlayer(discord.ui.View):
         else:
             print('[get_view] volume < 0')
 
+        page = self.get_page()
+        self.children[5].disabled = page == 0
+        self.children[6].disabled = page == self.get_page_count() - 1
+
         return self
     
     async def interaction_check(self, interaction: discord.Interaction):
+        # turning pages does not need a voice channel
+        if interaction.data.get('custom_id') in ('MusicPlayer:prev_page', 'MusicPlayer:next_page'):
+            return True
+        error = await self.join_voice(interaction)
+        if error is not None:
+            await interaction.response.send_message(error)
+            return False
+        return True
+
+    @staticmethod
+    async def join_voice(interaction: discord.Interaction):
+        # returns the message to show when the user cannot use the player, None once the bot is in their channel
         guild = interaction.guild
-        if interaction.user.voice is not None:
-            if guild.voice_client is None or not guild.voice_client.is_connected():
-                await interaction.user.voice.channel.connect(timeout=2)
-                return True
-            if interaction.user.voice.channel == guild.voice_client.channel:
-                return True
-            if not guild.voice_client.is_playing():
-                await guild.voice_client.move_to(interaction.user.voice.channel, timeout=2)
-                return True
-            else:
-                await interaction.response.send_message(f'{interaction.user.mention} 다른 채널에서 사용하고 있어요...')
-        else:
-            await interaction.response.send_message(f'{interaction.user.mention} 음성 채널에 참여해야 사용할 수 있어요...')
-        return False
+        if interaction.user.voice is None:
+            return f'{interaction.user.mention} 음성 채널에 참여해야 사용할 수 있어요...'
+        if guild.voice_client is None or not guild.voice_client.is_connected():
+            await interaction.user.voice.channel.connect(timeout=2)
+            return None
+        if interaction.user.voice.channel == guild.voice_client.channel:
+            return None
+        if not guild.voice_client.is_playing():
+            await guild.voice_client.move_to(interaction.user.voice.channel, timeout=2)
+            return None
+        return f'{interaction.user.mention} 다른 채널에서 사용하고 있어요...'
         
     async def search_modal_interaction_check(self, interaction: discord.Interaction):
         keyword = interaction.data['components'][0]['components'][0]['value']
         url = interaction.data['components'][1]['components'][0]['value']
         return keyword or url
     
+    async def edit_modal_interaction_check(self, interaction: discord.Interaction):
+        try:
+            values = [component['components'][0]['value'] for component in interaction.data['components']]
+            remove, move_from, move_to = [int(value) if value else None for value in values]
+        except Exception:
+            return False
+
+        length = len(self.data.playlist)
+        if remove is None and move_from is None:
+            return False
+        if remove is not None and not 1 <= remove <= length:
+            return False
+        if (move_from is None) != (move_to is None):
+            return False
+        if move_from is not None and not (1 <= move_from <= length and 1 <= move_to <= length):
+            return False
+        # the playing song stays first while something is playing
+        if self.is_active() and (remove == 1 or move_from == 1 or move_to == 1):
+            return False
+        return True
+
     async def volume_modal_interaction_check(self, interaction: discord.Interaction):
         try:
             volume = int(interaction.data['components'][0]['components'][0]['value'])
@@ -195,65 +332,212 @@ class MusicPlayer(discord.ui.View):
             self.play_song()
             return
         
-        await self.data['sent_msg']['MusicPlayer'].edit(embed=self.get_embed(), view=self.get_view())
+        self.render()
 
     def play_song(self):
-        playlist = self.data['playlist']
+        asyncio.run_coroutine_threadsafe(self.start_song(), self.bot.loop)
+
+    async def start_song(self):
+        playlist = self.data.playlist
         if playlist:
-            self.guild.voice_client.play(
-                discord.PCMVolumeTransformer(
-                    discord.FFmpegPCMAudio(
-                        playlist[0]['source'],
-                        before_options='-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-                        options='-vn',
-                    ),
-                    self.data['volume'],
-                ),
-                after=self.play_after,
-                bitrate=512,
-                expected_packet_loss=0.01,
-                signal_type='music',
-            )
+            audio = await self.open_audio(playlist.head.song)
+            voice_client = self.guild.voice_client
+            if audio is None:
+                print('[start_song] could not resolve the stream url')
+            elif voice_client is None or not voice_client.is_connected() or voice_client.is_playing() or voice_client.is_paused():
+                audio.cleanup()
+            else:
+                voice_client.play(
+                    audio,
+                    after=self.play_after,
+                    bitrate=512,
+                    expected_packet_loss=0.01,
+                    signal_type='music',
+                )
+                self.schedule_prefetch()
         else:
             print('[play_song] playlist is empty')
-            
-        asyncio.run_coroutine_threadsafe(self.data['sent_msg']['MusicPlayer'].edit(embed=self.get_embed(), view=self.get_view()), self.bot.loop)
+
+        self.render()
+
+    async def open_audio(self, song: Song):
+        prefetch = self.data.prefetch
+        self.data.prefetch = None
+        if prefetch is not None:
+            id, volume, audio, cached = prefetch
+            if id == song.id and volume == self.data.volume:
+                if self.bot.audio_cache is not None:
+                    self.bot.audio_cache.record(cached)
+                return audio
+            audio.cleanup()
+
+        source = await self.resolve_input(song)
+        if source is None:
+            return None
+        return create_audio(source, self.data.volume)
+
+    async def resolve_input(self, song: Song, count: bool = True):
+        # a cached file plays without touching YouTube, otherwise the stream is played and cached in the background
+        audio_cache = self.bot.audio_cache
+        if audio_cache is not None:
+            path = audio_cache.get_path(song.id, count)
+            if path is not None:
+                return path
+
+        source = await self.resolve_source(song.id)
+        if source is not None and audio_cache is not None:
+            audio_cache.fill(song.id, source, self.time_to_seconds(song.length))
+        return source
+
+    async def resolve_source(self, id: str):
+        # stream urls expire after a few hours, history.get_source returns None once one is close to its expiry
+        source = self.history.get_source(id)
+        if source is not None:
+            return source
+
+        song = await self.extract_yt_song(id)
+        if song is None:
+            return None
+        self.history.put(song)
+        return song['source']
+
+    def get_next_song(self):
+        playlist = self.data.playlist
+        if len(playlist) > 1:
+            return playlist.peek(1).song
+        elif playlist and self.data.repeat != 0:
+            return playlist.head.song
+        return None
+
+    def schedule_prefetch(self):
+        if self.data.prefetch_task is not None:
+            self.data.prefetch_task.cancel()
+        self.data.prefetch_task = None
+
+        next_song = self.get_next_song()
+        if next_song is not None and self.is_active():
+            delay = max(self.time_to_seconds(self.data.playlist.head.song.length) - PREFETCH_LEAD_S, 0)
+            self.data.prefetch_task = asyncio.create_task(self.prefetch(next_song, delay))
+
+    async def prefetch(self, song: Song, delay: float):
+        try:
+            if await self.resolve_input(song, count=False) is None:
+                return
+            await asyncio.sleep(delay)
+            # resolved again in case the url neared its expiry while waiting
+            source = await self.resolve_input(song, count=False)
+        except asyncio.CancelledError:
+            return
+        if source is not None:
+            if self.data.prefetch is not None:
+                self.data.prefetch[2].cleanup()
+            # the hit or miss is counted by open_audio, if the prefetched audio is the one that plays
+            audio_cache = self.bot.audio_cache
+            cached = audio_cache is not None and source == audio_cache.get_file_path(song.id)
+            self.data.prefetch = (song.id, self.data.volume, create_audio(source, self.data.volume), cached)
 
     def play_after(self, error: Exception = None):
+        # called on the audio player thread, the queue is only ever edited on the loop
+        self.bot.loop.call_soon_threadsafe(self.advance_song, error)
+
+    def advance_song(self, error: Exception = None):
         if self.guild.voice_client is not None and self.guild.voice_client.is_connected():
-            playlist = self.data['playlist']
-            repeat = self.data['repeat']
+            playlist = self.data.playlist
+            repeat = self.data.repeat
             if error:
-                print(f'[play_after] {error}')
+                print(f'[advance_song] {error}')
             if playlist:
-                if repeat == 0:
-                    del playlist[0]
-                elif repeat == 1 or repeat == 2:
-                    playlist.append(playlist.pop(0))
+                if repeat == 0 or repeat == 1 or repeat == 2:
+                    playlist.advance(repeat)
                 else:
-                    print('[play_after] repeat != (0 or 1 or 2)')
+                    print('[advance_song] repeat != (0 or 1 or 2)')
                     
                 self.play_song()
             else:
-                asyncio.run_coroutine_threadsafe(self.data['sent_msg']['MusicPlayer'].edit(embed=self.get_embed(), view=self.get_view()), self.bot.loop)
+                self.render()
 
     async def skip_btn_callback(self, interaction: discord.Interaction):
         asyncio.run_coroutine_threadsafe(interaction.response.defer(), self.bot.loop)
         self.author = interaction.user
+
+        if self.data.import_task is not None:
+            self.data.import_task.cancel()
         
         guild = interaction.guild
         if guild.voice_client.is_playing() or guild.voice_client.is_paused():
             guild.voice_client.stop()
         else:
-            self.play_after()
+            self.advance_song()
+
+    async def prev_page_btn_callback(self, interaction: discord.Interaction):
+        asyncio.run_coroutine_threadsafe(interaction.response.defer(), self.bot.loop)
+        self.author = interaction.user
+
+        self.data.page = max(self.get_page() - 1, 0)
+
+        self.render()
+
+    async def next_page_btn_callback(self, interaction: discord.Interaction):
+        asyncio.run_coroutine_threadsafe(interaction.response.defer(), self.bot.loop)
+        self.author = interaction.user
+
+        self.data.page = min(self.get_page() + 1, self.get_page_count() - 1)
+
+        self.render()
+
+    def is_active(self):
+        voice_client = self.guild.voice_client
+        return voice_client is not None and voice_client.is_connected() and (voice_client.is_playing() or voice_client.is_paused())
+
+    async def shuffle_btn_callback(self, interaction: discord.Interaction):
+        asyncio.run_coroutine_threadsafe(interaction.response.defer(), self.bot.loop)
+        self.author = interaction.user
+
+        self.data.playlist.shuffle(keep_head=self.is_active())
+        self.schedule_prefetch()
+
+        self.render()
+
+    async def dedupe_btn_callback(self, interaction: discord.Interaction):
+        asyncio.run_coroutine_threadsafe(interaction.response.defer(), self.bot.loop)
+        self.author = interaction.user
+
+        self.data.playlist.dedupe()
+        self.schedule_prefetch()
+
+        self.render()
+
+    async def edit_btn_callback(self, interaction: discord.Interaction):
+        edit_modal = discord.ui.Modal(title='플레이리스트 편집하기 ✂️')
+        edit_modal.add_item(discord.ui.TextInput(label='뺄 노래', placeholder='플레이리스트에서 뺄 노래 번호를 입력해요', required=False, row=0))
+        edit_modal.add_item(discord.ui.TextInput(label='옮길 노래', placeholder='옮길 노래 번호를 입력해요', required=False, row=1))
+        edit_modal.add_item(discord.ui.TextInput(label='옮길 위치', placeholder='노래를 옮길 번호를 입력해요', required=False, row=2))
+        edit_modal.interaction_check = self.edit_modal_interaction_check
+        edit_modal.on_submit = self.edit_modal_on_submit
+        asyncio.run_coroutine_threadsafe(interaction.response.send_modal(edit_modal), self.bot.loop)
+
+    async def edit_modal_on_submit(self, interaction: discord.Interaction):
+        await interaction.response.defer()
+        self.author = interaction.user
+
+        values = [component['components'][0]['value'] for component in interaction.data['components']]
+        remove, move_from, move_to = [int(value) if value else None for value in values]
+        playlist = self.data.playlist
+        if move_from is not None:
+            playlist.move(move_from - 1, move_to - 1)
+        if remove is not None:
+            playlist.remove_at(remove - 1)
+        self.schedule_prefetch()
+
+        self.render()
 
     async def repeat_btn_callback(self, interaction: discord.Interaction):
         asyncio.run_coroutine_threadsafe(interaction.response.defer(), self.bot.loop)
         self.author = interaction.user
         
-        self.data['repeat'] = (self.data['repeat'] + 1) % 3
+        self.data.repeat = (self.data.repeat + 1) % 3
         
-        await self.data['sent_msg']['MusicPlayer'].edit(embed=self.get_embed(), view=self.get_view())
+        self.render()
 
     async def search_btn_callback(self, interaction: discord.Interaction):     
         search_modal = discord.ui.Modal(title='노래 가져오기 🎹')
@@ -263,7 +547,7 @@ class MusicPlayer(discord.ui.View):
         search_modal.on_submit = self.search_modal_on_submit
         asyncio.run_coroutine_threadsafe(interaction.response.send_modal(search_modal), self.bot.loop)
 
-        await self.data['sent_msg']['MusicPlayer'].edit(embed=self.get_embed(), view=self.get_view())
+        self.render()
 
     async def volume_btn_callback(self, interaction: discord.Interaction):     
         volume_modal = discord.ui.Modal(title='음량 조절하기 🔈')
@@ -272,7 +556,7 @@ class MusicPlayer(discord.ui.View):
         volume_modal.on_submit = self.volume_modal_on_submit
         asyncio.run_coroutine_threadsafe(interaction.response.send_modal(volume_modal), self.bot.loop)
 
-        await self.data['sent_msg']['MusicPlayer'].edit(embed=self.get_embed(), view=self.get_view())
+        self.render()
 
     async def search_modal_on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer()
@@ -291,11 +575,11 @@ class MusicPlayer(discord.ui.View):
                     await self.append_yt_song(id, author)
             else:
 
-                await self.data['sent_msg']['MusicPlayer'].reply(f'{interaction.user.mention} 지원하지 않는 URL이에요...')
+                await self.data.sent_msg['MusicPlayer'].reply(f'{interaction.user.mention} 지원하지 않는 URL이에요...')
 
     async def pick_yt_search10(self, keyword: str, author: discord.Member):
         search_list = await self.load_yt_search10(keyword)
-        message = await self.data['sent_msg']['MusicPlayer'].reply(embed=self.get_yt_search10_embed(keyword, search_list, author))
+        message = await self.data.sent_msg['MusicPlayer'].reply(embed=self.get_yt_search10_embed(keyword, search_list, author))
 
         index_emoji_list = list(self.index_dict.keys())
         for i in range(len(search_list)):
@@ -317,7 +601,7 @@ class MusicPlayer(discord.ui.View):
     async def load_yt_search10(self, keyword: str):
         search_list = []
         async with self.channel.typing():
-            info = await self.bot.loop.run_in_executor(None, self.ytdlp.extract_info, f'ytsearch10:{keyword}', False)
+            info = await self.bot.extractor.search(keyword)
         if info is not None:
             if 'entries' in info:
                 for song in info['entries']:
@@ -337,6 +621,27 @@ class MusicPlayer(discord.ui.View):
         
         return search_list
 
+    async def append_keyword(self, keyword: str, author: discord.Member):
+        is_list, id = self.url_to_id(keyword)
+        if id is not None:
+            if is_list:
+                await self.append_yt_playlist(id, author)
+            else:
+                await self.append_yt_song(id, author)
+            return
+
+        # a song played before is taken from the title index only when the keyword names it, otherwise YouTube is searched
+        match = next((entry for entry in self.history.search(keyword, limit=5) if entry.is_strong_match(keyword)), None)
+        if match is not None:
+            id = match.id
+        else:
+            search_list = await self.load_yt_search10(keyword)
+            if not search_list:
+                await self.data.sent_msg['MusicPlayer'].reply(f'{author.mention} "{keyword}" 검색 결과가 없어요...')
+                return
+            id = search_list[0]['id']
+        await self.append_yt_song(id, author)
+
     def get_yt_search10_embed(self, keyword: str, list: list[dict[str, str]], author: discord.Member):
         embed = discord.Embed(
             color=discord.Color.blurple(),
@@ -349,23 +654,38 @@ class MusicPlayer(discord.ui.View):
         return embed
     
     async def append_yt_song(self, id: str, author: discord.Member):
-        playlist = self.data['playlist']
-        if id in self.history:
-            song = self.history[id]
-            playlist.append(song)
+        playlist = self.data.playlist
+        song = self.history.get(id)
+        if song is not None:
+            playlist.append(Track(song, author.id))
             self.author = author
-            await self.data['sent_msg']['MusicPlayer'].edit(embed=self.get_embed(), view=self.get_view())
+            self.render()
             return
-        song = await self.load_yt_song(id)
-        if song is not None:
-            self.history[song['id']] = song
-            playlist.append(song)
+        info = await self.load_yt_song(id)
+        if info is not None:
+            # the stream url stays in the history, it is resolved again right before the song plays
+            song = self.history.put(info)
+            playlist.append(Track(song, author.id))
             self.author = author
-            await self.data['sent_msg']['MusicPlayer'].edit(embed=self.get_embed(), view=self.get_view())
+            self.render()
 
     async def load_yt_song(self, id: str):
         async with self.channel.typing():
-            info = await self.bot.loop.run_in_executor(None, self.ytdlp.extract_info, 'https://music.youtube.com/watch?v=' + id, False)
+            return await self.extract_yt_song(id)
+
+    async def extract_yt_song(self, id: str):
+        info = await self.bot.extractor.extract_info('https://music.youtube.com/watch?v=' + id, 'song')
+        return self.info_to_song(info)
+
+    async def resolve_song(self, id: str):
+        song = self.history.get(id)
+        if song is None:
+            info = await self.extract_yt_song(id)
+            if info is not None:
+                song = self.history.put(info)
+        return song
+
+    def info_to_song(self, info: dict):
         if info is not None:
             if all(key in info for key in ['duration', 'id', 'thumbnail', 'thumbnails', 'title', 'url', 'webpage_url']):
                 song = {
@@ -402,6 +722,13 @@ class MusicPlayer(discord.ui.View):
             hours, minutes = divmod(minutes, 60)
             return f'{hours}:{minutes:02d}:{seconds:02d}'
 
+    @staticmethod
+    def time_to_seconds(time: str):
+        seconds = 0
+        for part in time.split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
+
     @staticmethod
     def get_square_thumbnail(thumbnails: list[dict[str, int | str]]):
         max_res_square = 0
@@ -437,13 +764,60 @@ class MusicPlayer(discord.ui.View):
         
     async def append_yt_playlist(self, id: str, author: discord.Member):
         song_id_list = await self.load_yt_playlist(id)
-        for song_id in song_id_list:
-            await self.append_yt_song(song_id, author)
+        if not song_id_list:
+            return
+
+        self.author = author
+        if self.data.import_task is not None:
+            self.data.import_task.cancel()
+        task = asyncio.create_task(self.import_yt_playlist(song_id_list, author))
+        self.data.import_task = task
+        try:
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise
+            print('[append_yt_playlist] import cancelled')
+        finally:
+            if self.data.import_task is task:
+                self.data.import_task = None
+
+        self.render()
+
+    async def import_yt_playlist(self, song_id_list: list[str], author: discord.Member):
+        playlist = self.data.playlist
+        semaphore = asyncio.Semaphore(PLAYLIST_IMPORT_CONCURRENCY)
+
+        async def resolve(id: str):
+            async with semaphore:
+                return await self.resolve_song(id)
+
+        tasks = [asyncio.create_task(resolve(id)) for id in song_id_list]
+        started = False
+        try:
+            # awaited in playlist order, so songs are appended in order even though they resolve out of order
+            for i, task in enumerate(tasks):
+                song = await task
+                if song is None:
+                    continue
+                playlist.append(Track(song, author.id))
+
+                voice_client = self.guild.voice_client
+                if not started and voice_client is not None and voice_client.is_connected() and not voice_client.is_playing() and not voice_client.is_paused():
+                    started = True
+                    self.play_song()
+
+                self.data.import_progress = f'📥  플레이리스트를 가져오고 있어요 ({i + 1}/{len(tasks)})'
+                self.render()
+        finally:
+            self.data.import_progress = None
+            for task in tasks:
+                task.cancel()
 
     async def load_yt_playlist(self, id: str):
         song_id_list = []
         async with self.channel.typing():
-            info = await self.bot.loop.run_in_executor(None, self.ytdlp.extract_info, 'https://music.youtube.com/playlist?list=' + id, False)
+            info = await self.bot.extractor.extract_info('https://music.youtube.com/playlist?list=' + id, 'playlist')
         if info is not None:
             if 'entries' in info:
                 for song in info['entries']:
@@ -463,36 +837,141 @@ class MusicPlayer(discord.ui.View):
         self.author = interaction.user
 
         volume = int(interaction.data['components'][0]['components'][0]['value']) / 400
-        self.data['volume'] = volume
+        self.data.volume = volume
 
         guild = interaction.guild
         if guild.voice_client is not None and guild.voice_client.is_connected():
             if guild.voice_client.is_playing() or guild.voice_client.is_paused():
-                guild.voice_client.source.volume = volume
+                current = guild.voice_client.source
+                if current.is_opus():
+                    # the volume is part of the FFmpeg filter graph, so FFmpeg is restarted at the current position
+                    source = await self.resolve_input(self.data.playlist.head.song, count=False)
+                    # the track may have ended while the input was resolved, the next one already starts at the new volume
+                    voice_client = guild.voice_client
+                    if source is not None and voice_client is not None and voice_client.source is current and (voice_client.is_playing() or voice_client.is_paused()):
+                        # swapping the source resumes the player, so a paused guild is paused again right after
+                        paused = voice_client.is_paused()
+                        voice_client.source = create_audio(source, volume, current.position)
+                        if paused:
+                            voice_client.pause()
+                        current.cleanup()
+                else:
+                    current.audio.volume = volume
         
-        await self.data['sent_msg']['MusicPlayer'].edit(embed=self.get_embed(), view=self.get_view())
+        self.render()
 
 
 @app_commands.guild_only()
 class Music(commands.GroupCog, name='노래'):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        if bot.cluster is not None:
+            bot.cluster.register('music_stats', self.get_music_stats)
 
-    @commands.GroupCog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author == self.bot.user and message.content == '노래 관련 기능을 사용해요':
-            await MusicPlayer.from_message(message, self.bot)
+    def get_music_stats(self):
+        voice_clients = self.bot.voice_clients
+        return {
+            'voice': len(voice_clients),
+            'playing': sum(voice_client.is_playing() for voice_client in voice_clients),
+            'queued': sum(len(data.playlist) for data in self.bot.data.values()),
+        }
+
+    async def cog_load(self):
+        self.bot.intent_bus.subscribe(intent_bus.MUSIC, self.on_music_intent)
+
+    async def cog_unload(self):
+        self.bot.intent_bus.unsubscribe(intent_bus.MUSIC, self.on_music_intent)
+
+    async def on_music_intent(self, trigger_msg: discord.Message):
+        await MusicPlayer.from_message(trigger_msg, self.bot)
 
     @commands.GroupCog.listener()
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
         if member == self.bot.user and before.channel is not None and after.channel is None:
-            await MusicPlayer.from_sent_msg(self.bot.data[member.guild.id]['sent_msg']['MusicPlayer'], self.bot)
+            data = self.bot.data[member.guild.id]
+            if data.import_task is not None:
+                data.import_task.cancel()
+            if data.prefetch_task is not None:
+                data.prefetch_task.cancel()
+                data.prefetch_task = None
+            if data.prefetch is not None:
+                data.prefetch[2].cleanup()
+                data.prefetch = None
+            await MusicPlayer.from_sent_msg(self.bot.data[member.guild.id].sent_msg['MusicPlayer'], self.bot)
 
     @app_commands.command(name='리모컨', description='노래 관련 기능을 사용해요')
     async def remote_control(self, interaction: discord.Interaction):
         await interaction.response.defer(thinking=True)
         await MusicPlayer.from_interaction(interaction, self.bot)
 
+    @app_commands.command(name='재생', description='노래를 찾아서 재생 목록에 추가해요')
+    @app_commands.rename(keyword='검색어')
+    @app_commands.describe(keyword='노래 제목, 가수 이름이나 URL을 입력해요')
+    async def play(self, interaction: discord.Interaction, keyword: str):
+        # deferred first, joining the voice channel can take longer than the interaction deadline
+        await interaction.response.defer(thinking=True)
+        error = await MusicPlayer.join_voice(interaction)
+        if error is not None:
+            await interaction.followup.send(error)
+            return
+        music_player = await MusicPlayer.from_interaction(interaction, self.bot)
+        await music_player.append_keyword(keyword, interaction.user)
+        if not music_player.is_active():
+            music_player.play_song()
+
+    @play.autocomplete('keyword')
+    async def play_autocomplete(self, interaction: discord.Interaction, current: str):
+        # answered from memory, so typing never waits on YouTube
+        choices = [
+            app_commands.Choice(name=self.get_choice_name(song.title, song.artist), value=song.url)
+            for song in self.bot.history.search(current, limit=25)
+            if len(song.url) <= 100
+        ]
+        if not choices and current.strip():
+            info = self.bot.extractor.get_search(current)
+            if info is not None:
+                choices = [
+                    app_commands.Choice(name=self.get_choice_name(entry['title']), value=entry['url'])
+                    for entry in info.get('entries', [])[:25]
+                    if 'title' in entry and 'url' in entry and len(entry['url']) <= 100
+                ]
+        return choices
+
+    @staticmethod
+    def get_choice_name(title: str, artist: str = None):
+        name = title if artist is None else f'{title} - {artist}'
+        return name if len(name) <= 100 else name[:99] + '…'
+
+    @app_commands.command(name='통계', description='리모컨 수정과 노래 정보를 가져오는 작업의 상태를 보여줘요')
+    async def show_stats(self, interaction: discord.Interaction):
+        stats = self.bot.extractor.get_stats()
+        render_stats = self.bot.data[interaction.guild_id].render.get_stats()
+        lines = [
+            f'리모컨 수정 {render_stats["sent"]}회, 합쳐진 수정 {render_stats["coalesced"]}회',
+            f'대기 중인 작업 {stats["queue_depth"]}개, 합쳐진 요청 {stats["coalesced"]}개, 저장된 검색 결과 사용 {stats["search_hits"]}회',
+        ]
+        if self.bot.audio_cache is not None:
+            cache_stats = self.bot.audio_cache.get_stats()
+            lines.append(f'저장된 노래 {cache_stats["files"]}개({cache_stats["bytes"] / 2 ** 30:.1f}GB), 적중 {cache_stats["hits"]}회, 실패 {cache_stats["misses"]}회')
+        for kind, summary in stats['timings'].items():
+            lines.append(f'{kind}: {summary["count"]}회, p50 {summary["p50_ms"]:.0f}ms, p95 {summary["p95_ms"]:.0f}ms')
+        if self.bot.cluster is not None:
+            await interaction.response.defer(thinking=True)
+            health_list = await self.bot.cluster.query('health')
+            music_stats_list = [music_stats for music_stats in await self.bot.cluster.query('music_stats') if music_stats is not None]
+            lines.append(
+                f'클러스터 {len(health_list)}개, 서버 {sum(health.get("guilds", 0) for health in health_list)}개, '
+                f'음성 연결 {sum(music_stats["voice"] for music_stats in music_stats_list)}개, '
+                f'재생 중 {sum(music_stats["playing"] for music_stats in music_stats_list)}개, '
+                f'대기 중인 노래 {sum(music_stats["queued"] for music_stats in music_stats_list)}개'
+            )
+            for health in health_list:
+                latency = health.get('latency')
+                lines.append(f'클러스터 {health["cluster"]}: 서버 {health.get("guilds", 0)}개, 지연 {latency * 1000:.0f}ms' if latency is not None else f'클러스터 {health["cluster"]}: 준비 중')
+            await interaction.followup.send('\n'.join(lines))
+            return
+        await interaction.response.send_message('\n'.join(lines))
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Music(bot))
\ No newline at end of file
@@ -0,0 +1,117 @@
+import argparse
+import random
+
+import torch
+from torch.nn import functional as F
+from transformers import ElectraForSequenceClassification
+
+from classifier import NUM_LABELS, load_dataset, load_tokenizer, load_torch_model
+from parity import evaluate_isolated
+
+
+def get_teacher_logits(teacher: torch.nn.Module, tokenizer, texts: list[str], batch_size: int, max_length: int, device: torch.device):
+    logits = []
+    with torch.inference_mode():
+        for i in range(0, len(texts), batch_size):
+            inputs = tokenizer(texts[i:i + batch_size], return_tensors='pt', padding=True, truncation=True, max_length=max_length).to(device)
+            logits.append(teacher(**inputs).logits.float().cpu())
+    return torch.cat(logits)
+
+
+def distill(args: argparse.Namespace):
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    texts, labels = load_dataset(args.train)
+    teacher = load_torch_model(args.teacher_name, args.teacher_weights, device)
+    teacher_logits = get_teacher_logits(teacher, load_tokenizer(args.teacher_name), texts, args.batch_size, args.max_length, device)
+    del teacher
+
+    tokenizer = load_tokenizer(args.student_name)
+    student = ElectraForSequenceClassification.from_pretrained(args.student_name, num_labels=NUM_LABELS)
+    student.to(device)
+    optimizer = torch.optim.AdamW(student.parameters(), lr=args.lr)
+    labels = torch.tensor(labels)
+
+    for epoch in range(args.epochs):
+        student.train()
+        order = list(range(len(texts)))
+        random.shuffle(order)
+        total_loss = 0.0
+        correct = 0
+
+        for i in range(0, len(order), args.batch_size):
+            index = order[i:i + args.batch_size]
+            inputs = tokenizer([texts[j] for j in index], return_tensors='pt', padding=True, truncation=True, max_length=args.max_length).to(device)
+            y_batch = labels[index].to(device)
+            soft_targets = F.softmax(teacher_logits[index].to(device) / args.temperature, dim=1)
+
+            optimizer.zero_grad()
+            logits = student(**inputs).logits
+            # Hinton et al. soft-label loss, scaled by T^2 so its gradients stay comparable to the hard-label loss
+            soft_loss = F.kl_div(F.log_softmax(logits / args.temperature, dim=1), soft_targets, reduction='batchmean') * args.temperature ** 2
+            hard_loss = F.cross_entropy(logits, y_batch)
+            loss = args.alpha * soft_loss + (1 - args.alpha) * hard_loss
+            loss.backward()
+            optimizer.step()
+
+            total_loss += loss.item() * len(index)
+            correct += (logits.argmax(dim=1) == y_batch).sum().item()
+
+        print(f'Epoch {epoch + 1}/{args.epochs}, Loss: {total_loss / len(texts):.4f}, Accuracy: {correct / len(texts):.4f}')
+
+    torch.save(student.state_dict(), args.output)
+    print(f'[distill] wrote {args.output}')
+
+
+def report(args: argparse.Namespace):
+    def eval_args(model_name: str, weights: str):
+        return argparse.Namespace(
+            csv=args.validation,
+            model_name=model_name,
+            weights=weights,
+            onnx=None,
+            onnx_int8=None,
+            batch_size=args.batch_size,
+            latency_samples=args.latency_samples,
+            threads=args.threads,
+        )
+
+    reports = {
+        'teacher': evaluate_isolated('torch-eager', eval_args(args.teacher_name, args.teacher_weights)),
+        'student': evaluate_isolated('torch-eager', eval_args(args.student_name, args.output)),
+    }
+
+    print(f'{"model":<8} {"accuracy":>9} {"p50 ms":>8} {"p99 ms":>8} {"RSS MB":>8}')
+    for name, result in reports.items():
+        print(f'{name:<8} {result["accuracy"]:>9.4f} {result["p50_ms"]:>8.2f} {result["p99_ms"]:>8.2f} {result["rss_mb"]:>8.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distill the fine-tuned KoELECTRA-base intent classifier into KoELECTRA-small')
+    parser.add_argument('--train', default='train.csv')
+    parser.add_argument('--validation', default='validation.csv')
+    parser.add_argument('--teacher-name', default='monologg/koelectra-base-v3-discriminator')
+    parser.add_argument('--teacher-weights', default='model.pt')
+    parser.add_argument('--student-name', default='monologg/koelectra-small-v3-discriminator')
+    parser.add_argument('--output', default='student.pt')
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--max-length', type=int, default=256)
+    parser.add_argument('--lr', type=float, default=5e-5)
+    parser.add_argument('--temperature', type=float, default=2.0)
+    parser.add_argument('--alpha', type=float, default=0.7, help='weight of the soft-label loss against the hard-label loss')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency-samples', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--skip-training', action='store_true', help='only write the report for an existing --output')
+    args = parser.parse_args()
+
+    if not args.skip_training:
+        distill(args)
+    report(args)
+
+
+if __name__ == '__main__':
+    main()
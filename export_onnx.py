@@ -0,0 +1,62 @@
+import argparse
+
+import torch
+
+from classifier import load_tokenizer, load_torch_model
+
+
+class LogitsOnly(torch.nn.Module):
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+
+def export(model_name: str, weights_path: str, output_path: str, opset: int):
+    device = torch.device('cpu')
+    tokenizer = load_tokenizer(model_name)
+    model = load_torch_model(model_name, weights_path, device)
+
+    inputs = tokenizer(['노래 틀어줘', '주사위 던져줘'], return_tensors='pt', padding=True, truncation=True)
+    torch.onnx.export(
+        LogitsOnly(model),
+        (inputs['input_ids'], inputs['attention_mask']),
+        output_path,
+        input_names=['input_ids', 'attention_mask'],
+        output_names=['logits'],
+        dynamic_axes={
+            'input_ids': {0: 'batch', 1: 'sequence'},
+            'attention_mask': {0: 'batch', 1: 'sequence'},
+            'logits': {0: 'batch'},
+        },
+        opset_version=opset,
+    )
+    print(f'[export] wrote {output_path}')
+
+
+def quantize(input_path: str, output_path: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(input_path, output_path, weight_type=QuantType.QInt8)
+    print(f'[quantize] wrote {output_path}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the fine-tuned intent classifier to ONNX')
+    parser.add_argument('--model-name', default='monologg/koelectra-base-v3-discriminator')
+    parser.add_argument('--weights', default='model.pt')
+    parser.add_argument('--output', default='model.onnx')
+    parser.add_argument('--int8-output', default='model.int8.onnx')
+    parser.add_argument('--quantize', action='store_true', help='also write a dynamically int8-quantized copy')
+    parser.add_argument('--opset', type=int, default=17)
+    args = parser.parse_args()
+
+    export(args.model_name, args.weights, args.output, args.opset)
+    if args.quantize:
+        quantize(args.output, args.int8_output)
+
+
+if __name__ == '__main__':
+    main()
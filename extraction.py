@@ -0,0 +1,116 @@
+import asyncio
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from timings import StageTimings
+
+
+YTDLP_OPTIONS = {
+    'format': 'bestaudio/best',
+    'nocheckcertificate': True,
+    'ignoreerrors': True,
+    'logtostderr': False,
+    'quiet': True,
+    'no_warnings': True,
+    'default_search': 'auto',
+    'source_address': '0.0.0.0',
+    'extract_flat': True,
+    'skip_download': True,
+}
+
+# one YoutubeDL per worker process, created by the pool initializer and reused for every call
+ytdlp = None
+
+
+def init_worker():
+    global ytdlp
+    import yt_dlp
+
+    ytdlp = yt_dlp.YoutubeDL(YTDLP_OPTIONS)
+
+
+def extract_info(url: str):
+    info = ytdlp.extract_info(url, download=False)
+    # sanitize_info turns lazy entry lists into plain lists so the result can be pickled back to the bot
+    return ytdlp.sanitize_info(info) if info is not None else None
+
+
+def normalize_keyword(keyword: str):
+    return ' '.join(keyword.casefold().split())
+
+
+class ExtractionService:
+    def __init__(self, num_workers: int = 2, search_ttl_s: float = 6 * 60 * 60, search_max_entries: int = 1000):
+        self.pool = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_worker)
+        self.in_flight: dict[str, asyncio.Task] = {}
+        self.search_ttl_s = search_ttl_s
+        self.search_max_entries = search_max_entries
+        self.searches: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self.queue_depth = 0
+        self.coalesced = 0
+        self.search_hits = 0
+        self.timings = StageTimings(max_samples=1000)
+
+    async def extract_info(self, url: str, kind: str = 'song'):
+        # requests for the same url from any guild share one extraction
+        task = self.in_flight.get(url)
+        if task is None:
+            task = asyncio.create_task(self.run(url, kind))
+            self.in_flight[url] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(url, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def get_search(self, keyword: str, count: int = 10):
+        url = f'ytsearch{count}:{normalize_keyword(keyword)}'
+        entry = self.searches.get(url)
+        if entry is None:
+            return None
+        expires_at, info = entry
+        if expires_at < time.time():
+            del self.searches[url]
+            return None
+        self.searches.move_to_end(url)
+        return info
+
+    async def search(self, keyword: str, count: int = 10):
+        # search results are kept per normalized keyword, so '아이유  좋은날' and '아이유 좋은날' share one extraction
+        info = self.get_search(keyword, count)
+        if info is not None:
+            self.search_hits += 1
+            return info
+
+        url = f'ytsearch{count}:{normalize_keyword(keyword)}'
+        info = await self.extract_info(url, 'search')
+        if info is not None:
+            self.searches[url] = (time.time() + self.search_ttl_s, info)
+            self.searches.move_to_end(url)
+            while len(self.searches) > self.search_max_entries:
+                self.searches.popitem(last=False)
+        return info
+
+    async def run(self, url: str, kind: str):
+        self.queue_depth += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, extract_info, url)
+        except Exception as e:
+            print(f'[ExtractionService] {e!r}')
+            return None
+        finally:
+            self.queue_depth -= 1
+            self.timings.record(kind, (time.perf_counter() - start) * 1000)
+
+    def get_stats(self):
+        return {
+            'queue_depth': self.queue_depth,
+            'coalesced': self.coalesced,
+            'search_hits': self.search_hits,
+            'timings': self.timings.get_summary(),
+        }
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
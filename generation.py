@@ -0,0 +1,102 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class GenerationWorker:
+    def __init__(self, model_name: str, max_length: int = 50, budget_s: float = 3.0, max_queue: int = 4, timings=None):
+        self.model_name = model_name
+        self.timings = timings
+        self.max_length = max_length
+        self.budget_s = budget_s
+        self.pipeline = None
+        self.queue: queue.Queue[tuple[str, Future, float, object]] = queue.Queue(maxsize=max_queue)
+        self.load_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.thread: threading.Thread = None
+        self.generated = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def load(self):
+        # the GPT model is only needed by low-confidence messages, so it is loaded on the first one
+        with self.load_lock:
+            if self.pipeline is None:
+                from transformers import pipeline
+
+                self.pipeline = pipeline('text-generation', model=self.model_name, tokenizer=self.model_name)
+                print(f'[GenerationWorker] loaded {self.model_name}')
+        return self.pipeline
+
+    def start(self):
+        # the worker thread starts on the first fallback and loads the model itself before its first generation
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='GenerationWorker', daemon=True)
+                self.thread.start()
+
+    def submit(self, text: str, streamer: object = None):
+        # raises queue.Full right away instead of letting fallbacks pile up behind a slow generation
+        self.start()
+        future = Future()
+        try:
+            self.queue.put_nowait((text, future, time.monotonic() + self.budget_s, streamer))
+        except queue.Full:
+            self.rejected += 1
+            raise
+        return future
+
+    def generate(self, text: str):
+        # returns None when the queue is full or the budget ran out
+        try:
+            return self.submit(text).result(timeout=self.budget_s)
+        except (queue.Full, TimeoutError):
+            return None
+
+    def stream(self, text: str):
+        from transformers import TextIteratorStreamer
+
+        streamer = TextIteratorStreamer(self.load().tokenizer, timeout=self.budget_s)
+        self.submit(text, streamer)
+        try:
+            yield from streamer
+        except queue.Empty:
+            return
+
+    def run(self):
+        while True:
+            text, future, deadline, streamer = self.queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.timed_out += 1
+                future.set_exception(TimeoutError('generation budget spent in the queue'))
+                if streamer is not None:
+                    streamer.end()
+                continue
+
+            try:
+                start = time.perf_counter()
+                # max_time stops generate() itself at the deadline, the result is whatever was produced by then
+                outputs = self.load()(text, max_length=self.max_length, num_return_sequences=1, max_time=remaining, streamer=streamer)
+                if self.timings is not None:
+                    self.timings.record('gpt_fallback', (time.perf_counter() - start) * 1000)
+                self.generated += 1
+                future.set_result(outputs[0]['generated_text'])
+            except Exception as e:
+                print(f'[GenerationWorker] {e}')
+                future.set_exception(e)
+                if streamer is not None:
+                    streamer.end()
+
+    def get_stats(self):
+        return {
+            'loaded': self.pipeline is not None,
+            'queued': self.queue.qsize(),
+            'generated': self.generated,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+        }
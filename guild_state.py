@@ -0,0 +1,185 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+import discord
+
+from render import RenderScheduler
+from song_cache import SongCache
+from track_queue import Track, TrackQueue
+
+
+class GuildState:
+    __slots__ = (
+        'guild_id', '_nlp', '_repeat', '_volume', 'playlist', 'sent_msg',
+        'prefetch', 'prefetch_task', 'import_task', 'import_progress', 'render', 'page', 'page_cache',
+        'dirty', 'saved_version',
+    )
+
+    def __init__(self, guild_id: int, nlp: bool = True, repeat: int = 0, volume: float = 0.1, playlist: TrackQueue = None):
+        self.guild_id = guild_id
+        self._nlp = nlp
+        self._repeat = repeat
+        self._volume = volume
+        self.playlist = playlist if playlist is not None else TrackQueue()
+        self.sent_msg: dict[str, discord.Message] = {}
+        self.prefetch: tuple[str, float, discord.AudioSource, bool] = None
+        self.prefetch_task: asyncio.Task = None
+        self.import_task: asyncio.Task = None
+        self.import_progress: str = None
+        self.render = RenderScheduler()
+        self.page = 0
+        self.page_cache: dict[int, tuple[int, str]] = {}
+        self.dirty = False
+        self.saved_version = self.playlist.version
+
+    # only the settings and the queue outlive a restart, messages and tasks belong to the running process
+    @property
+    def nlp(self):
+        return self._nlp
+
+    @nlp.setter
+    def nlp(self, value: bool):
+        self._nlp = value
+        self.dirty = True
+
+    @property
+    def repeat(self):
+        return self._repeat
+
+    @repeat.setter
+    def repeat(self, value: int):
+        self._repeat = value
+        self.dirty = True
+
+    @property
+    def volume(self):
+        return self._volume
+
+    @volume.setter
+    def volume(self, value: float):
+        self._volume = value
+        self.dirty = True
+
+    def needs_save(self):
+        return self.dirty or self.playlist.version != self.saved_version
+
+
+class GuildStateStore:
+    def __init__(self, path: str, history: SongCache, flush_interval_s: float = 30):
+        self.path = path
+        self.history = history
+        self.flush_interval_s = flush_interval_s
+        self.connection: sqlite3.Connection = None
+        self.lock = threading.Lock()
+        self.states: dict[int, GuildState] = {}
+        self.saved: dict[int, tuple[bool, int, float, str]] = {}
+        self.flush_task: asyncio.Task = None
+        self.flushes = 0
+        self.written = 0
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS guild_state (
+                    guild_id INTEGER PRIMARY KEY,
+                    nlp INTEGER NOT NULL,
+                    repeat INTEGER NOT NULL,
+                    volume REAL NOT NULL,
+                    playlist TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+        return self.connection
+
+    def load(self):
+        # one query for every guild, the rows stay as tuples until a guild is used
+        with self.lock:
+            rows = self.connect().execute('SELECT guild_id, nlp, repeat, volume, playlist FROM guild_state').fetchall()
+        self.saved = {guild_id: (bool(nlp), repeat, volume, playlist) for guild_id, nlp, repeat, volume, playlist in rows}
+        print(f'[GuildStateStore] {len(self.saved)} saved guilds')
+
+    def __getitem__(self, guild_id: int):
+        state = self.states.get(guild_id)
+        if state is None:
+            state = self.create(guild_id)
+            self.states[guild_id] = state
+        return state
+
+    def __contains__(self, guild_id: int):
+        return guild_id in self.states
+
+    def values(self):
+        return self.states.values()
+
+    def create(self, guild_id: int):
+        saved = self.saved.pop(guild_id, None)
+        if saved is None:
+            return GuildState(guild_id)
+
+        nlp, repeat, volume, playlist_json = saved
+        saved_tracks = json.loads(playlist_json)
+        songs = self.history.get_many([song_id for song_id, _ in saved_tracks])
+        playlist = TrackQueue()
+        for song_id, requester_id in saved_tracks:
+            # songs evicted from the history since the last run are dropped from the queue
+            song = songs.get(song_id)
+            if song is not None:
+                playlist.append(Track(song, requester_id))
+        state = GuildState(guild_id, nlp, repeat, volume, playlist)
+        state.saved_version = playlist.version
+        return state
+
+    def start(self):
+        self.flush_task = asyncio.create_task(self.flush_loop())
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval_s)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f'[GuildStateStore] {e!r}')
+
+    async def flush(self):
+        # rows are built on the loop, where every queue edit happens, and written on a thread
+        pending = []
+        now = time.time()
+        for state in self.states.values():
+            if state.needs_save():
+                playlist = json.dumps([(track.song.id, track.requester_id) for track in list(state.playlist.tracks)])
+                pending.append((state, state.playlist.version, (state.guild_id, state.nlp, state.repeat, state.volume, playlist, now)))
+        if pending:
+            await asyncio.to_thread(self.write, [row for _, _, row in pending])
+            # a guild only counts as saved once the write went through, edits made during the write are saved next time
+            for state, version, row in pending:
+                state.saved_version = version
+                if (state.nlp, state.repeat, state.volume) == row[1:4]:
+                    state.dirty = False
+            self.flushes += 1
+            self.written += len(pending)
+
+    def write(self, rows: list[tuple]):
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('BEGIN')
+                connection.executemany('INSERT OR REPLACE INTO guild_state (guild_id, nlp, repeat, volume, playlist, updated_at) VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    async def close(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        await self.flush()
+
+    def get_stats(self):
+        return {
+            'active': len(self.states),
+            'saved': len(self.saved),
+            'flushes': self.flushes,
+            'written': self.written,
+        }
@@ -0,0 +1,35 @@
+from typing import Awaitable, Callable
+
+import discord
+
+
+# Labels of the intent classifier, 0 means the message asked for nothing
+RPS = 1
+DICE = 2
+MUSIC = 3
+CAUTION = 4
+
+
+class IntentBus:
+    def __init__(self):
+        self.handlers: dict[int, Callable[[discord.Message], Awaitable]] = {}
+        self.published = 0
+        self.unhandled = 0
+
+    def subscribe(self, label: int, handler: Callable[[discord.Message], Awaitable]):
+        self.handlers[label] = handler
+
+    def unsubscribe(self, label: int, handler: Callable[[discord.Message], Awaitable]):
+        if self.handlers.get(label) == handler:
+            del self.handlers[label]
+
+    async def publish(self, label: int, trigger_msg: discord.Message):
+        # the handler gets the user's own message, so the author is known without fetching anything
+        handler = self.handlers.get(label)
+        if handler is None:
+            self.unhandled += 1
+            print(f'[IntentBus] no handler for label {label}')
+            return False
+        self.published += 1
+        await handler(trigger_msg)
+        return True
@@ -0,0 +1,25 @@
+# Runs inside the bot's NLP process pool, torch is imported lazily so that the bot process itself never loads it
+tokenizer = None
+backend = None
+
+
+def init_worker(backend_name: str, model_name: str, weights_path: str, onnx_path: str, onnx_int8_path: str, num_threads: int):
+    global tokenizer, backend
+    import torch
+    from classifier import load_backend, load_tokenizer, predict_batch
+
+    torch.set_num_threads(num_threads)
+    tokenizer = load_tokenizer(model_name)
+    backend = load_backend(backend_name, model_name, weights_path, onnx_path, onnx_int8_path, torch.device('cpu'))
+    # the first forward pass allocates and tunes kernels, pay for it before the first real message
+    predict_batch(tokenizer, backend, ['노래 틀어줘'])
+
+
+def warm_up():
+    return backend is not None
+
+
+def predict_sentiment(text: str):
+    from classifier import predict_batch
+
+    return predict_batch(tokenizer, backend, [text])[0]
@@ -1,37 +1,137 @@
-from flask import Flask, request
+from concurrent.futures import Future
+from flask import Flask, Response, jsonify, request, stream_with_context
+import os
+import queue
 import random
+import threading
+import time
 import torch
-from transformers import AutoTokenizer, ElectraForSequenceClassification, pipeline
+
+from batcher import MicroBatcher
+from cache import PredictionCache
+from classifier import load_backend, load_tokenizer, predict_batch
+from generation import GenerationWorker
+from timings import StageTimings
 
 app = Flask(__name__)
 
+# tokenize / forward time per batch and GPT fallback time per message, reported on /stats for bench.py
+timings = StageTimings()
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+# One of classifier.BACKENDS, the ONNX files are written by export_onnx.py and checked by parity.py
+# The distilled student from distill.py is a drop-in: MODEL_NAME = "monologg/koelectra-small-v3-discriminator", MODEL_PATH = "student.pt"
+BACKEND = "torch-eager"
+MODEL_NAME = "monologg/koelectra-base-v3-discriminator"
+MODEL_PATH = "model.pt"
+ONNX_PATH = "model.onnx"
+ONNX_INT8_PATH = "model.int8.onnx"
+
 # Load the model and tokenizer for sentiment analysis
-tokenizer = AutoTokenizer.from_pretrained("monologg/koelectra-base-v3-discriminator")
-model = ElectraForSequenceClassification.from_pretrained("monologg/koelectra-base-v3-discriminator", num_labels=4)
-model.to(device)
-model.load_state_dict(torch.load("model.pt", map_location=device))
+tokenizer = load_tokenizer(MODEL_NAME)
+backend = load_backend(BACKEND, MODEL_NAME, MODEL_PATH, ONNX_PATH, ONNX_INT8_PATH, device)
+
+# Answers are cached per normalized message, the weights file is checked every WEIGHTS_CHECK_INTERVAL_S
+# and a changed file reloads the backend and empties the cache
+CACHE_MAX_SIZE = 10000
+CACHE_TTL_S = 600
+WEIGHTS_CHECK_INTERVAL_S = 5
+
+def get_weights_path():
+    return {"torch-eager": MODEL_PATH, "onnx-fp32": ONNX_PATH, "onnx-int8": ONNX_INT8_PATH}[BACKEND]
 
-# Load the GPT model
+def get_weights_version():
+    stat = os.stat(get_weights_path())
+    return (stat.st_mtime_ns, stat.st_size)
+
+cache = PredictionCache(max_size=CACHE_MAX_SIZE, ttl_s=CACHE_TTL_S, version=get_weights_version())
+weights_lock = threading.Lock()
+weights_checked_at = time.monotonic()
+
+def check_weights():
+    # only a stat on the request path, a changed file is loaded on its own thread while requests keep the old backend
+    global weights_checked_at
+    if time.monotonic() - weights_checked_at < WEIGHTS_CHECK_INTERVAL_S or not weights_lock.acquire(blocking=False):
+        return
+    try:
+        weights_checked_at = time.monotonic()
+        version = get_weights_version()
+    except Exception as e:
+        print(f'[check_weights] {e}')
+        weights_lock.release()
+        return
+    if version == cache.version:
+        weights_lock.release()
+        return
+    # the lock stays held until the reload is done, so no second reload starts meanwhile
+    threading.Thread(target=reload_weights, args=(version,), daemon=True).start()
+
+def reload_weights(version):
+    global backend
+    try:
+        new_backend = load_backend(BACKEND, MODEL_NAME, MODEL_PATH, ONNX_PATH, ONNX_INT8_PATH, device)
+        backend = new_backend
+        cache.set_version(version)
+        print(f'[reload_weights] reloaded {get_weights_path()}')
+    except Exception as e:
+        print(f'[reload_weights] {e}')
+    finally:
+        weights_lock.release()
+
+# The GPT model answers low-confidence messages, it is loaded on first use and runs on its own thread.
+# A fallback that cannot finish within GPT_BUDGET_S or does not fit in the queue is answered with label 0
 gpt_model_name = "gpt2"  # Example model name, replace with your desired GPT model
-gpt_pipeline = pipeline("text-generation", model=gpt_model_name, tokenizer=gpt_model_name)
+GPT_BUDGET_S = 3.0
+GPT_MAX_QUEUE = 4
+CONFIDENCE_THRESHOLD = 0.25
+gpt_worker = GenerationWorker(gpt_model_name, max_length=50, budget_s=GPT_BUDGET_S, max_queue=GPT_MAX_QUEUE, timings=timings)
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# Concurrent requests are grouped into one forward pass, waiting at most BATCH_MAX_WAIT_MS for the batch to fill
+BATCH_MAX_SIZE = 16
+BATCH_MAX_WAIT_MS = 5
+# Number of threads running forward passes, each one works on its own batch
+MODEL_WORKERS = 2
+# Upper bound on the number of messages accepted by one POST /classify
+CLASSIFY_MAX_MESSAGES = 256
+
+def predict_sentiment_batch(texts):
+    return predict_batch(tokenizer, backend, texts, timings=timings)
+
+batcher = MicroBatcher(predict_sentiment_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, num_workers=MODEL_WORKERS)
+
+def submit_sentiment(text):
+    check_weights()
+    result = cache.get(text)
+    if result is not None:
+        future = Future()
+        future.set_result(result)
+        return future
+
+    version = cache.version
+    future = batcher.submit(text)
+    future.add_done_callback(lambda done: done.cancelled() or done.exception() is not None or cache.put(text, done.result(), version))
+    return future
 
 def predict_sentiment(text):
-    inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True).to(device)
-    outputs = model(**inputs)
-    predicted_class = torch.argmax(outputs.logits).item()
-    predicted_prob = torch.softmax(outputs.logits, dim=1)[0][predicted_class].item()
-    return predicted_class, predicted_prob
+    return submit_sentiment(text).result()
+
+def parse_messages(payload):
+    if not isinstance(payload, list) or not all(isinstance(message, str) for message in payload):
+        return None
+    return payload
+
+def to_classify_response(results):
+    return [{'label': sentiment_class, 'prob': sentiment_prob} for sentiment_class, sentiment_prob in results]
 
 @app.route('/')
 def index():
     message = request.args.get('message', '')
     if message:
         sentiment_class, sentiment_prob = predict_sentiment(message)
-        if sentiment_prob < 0.25:
-            gpt_response = gpt_pipeline(message, max_length=50, num_return_sequences=1)[0]['generated_text']
-            return gpt_response
+        if sentiment_prob < CONFIDENCE_THRESHOLD:
+            gpt_response = gpt_worker.generate(message)
+            return gpt_response if gpt_response is not None else str(0)
         else:
             response_type = sentiment_class
     else:
@@ -39,5 +139,55 @@ def index():
 
     return str(response_type)
 
+@app.route('/classify', methods=['POST'])
+def classify():
+    messages = parse_messages(request.get_json(silent=True))
+    if messages is None:
+        return jsonify({'error': 'expected a JSON array of strings'}), 400
+    if len(messages) > CLASSIFY_MAX_MESSAGES:
+        return jsonify({'error': f'at most {CLASSIFY_MAX_MESSAGES} messages per request'}), 413
+
+    futures = [submit_sentiment(message) for message in messages]
+    return jsonify(to_classify_response([future.result() for future in futures]))
+
+@app.route('/generate')
+def generate():
+    message = request.args.get('message', '')
+    if not message:
+        return jsonify({'error': 'message is required'}), 400
+    try:
+        chunks = gpt_worker.stream(message)
+        next_chunk = next(chunks, '')
+    except queue.Full:
+        return jsonify({'error': 'too many generations in progress'}), 503
+
+    def stream():
+        yield next_chunk
+        yield from chunks
+
+    return Response(stream_with_context(stream()), mimetype='text/plain')
+
+def get_stats():
+    return {
+        'batch_size_histogram': batcher.get_histogram(),
+        'cache': cache.get_stats(),
+        'generation': gpt_worker.get_stats(),
+        'timings': timings.get_summary(),
+    }
+
+def reset_stats_state():
+    # the cache is emptied too, otherwise a benchmark run measures the answers cached by the previous one
+    timings.reset()
+    cache.clear()
+
+@app.route('/stats')
+def stats():
+    return jsonify(get_stats())
+
+@app.route('/stats/reset', methods=['POST'])
+def reset_stats():
+    reset_stats_state()
+    return jsonify(get_stats())
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,86 @@
+import argparse
+import multiprocessing
+import resource
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+
+from classifier import BACKENDS, load_backend, load_dataset, load_tokenizer, predict_batch
+
+
+def percentile(values: list[float], q: float):
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1] if len(values) > 1 else values[0]
+
+
+def evaluate(backend_name: str, args: argparse.Namespace):
+    torch.set_num_threads(args.threads)
+    texts, labels = load_dataset(args.csv)
+    tokenizer = load_tokenizer(args.model_name)
+    backend = load_backend(backend_name, args.model_name, args.weights, args.onnx, args.onnx_int8, torch.device('cpu'))
+
+    correct = 0
+    for i in range(0, len(texts), args.batch_size):
+        results = predict_batch(tokenizer, backend, texts[i:i + args.batch_size])
+        correct += sum(predicted == label for (predicted, _), label in zip(results, labels[i:i + args.batch_size]))
+
+    # per-message latency is what the bot sees, so time single-message calls
+    latencies = []
+    for text in texts[:args.latency_samples]:
+        start = time.perf_counter()
+        predict_batch(tokenizer, backend, [text])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'backend': backend_name,
+        'accuracy': correct / len(texts),
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def evaluate_isolated(backend_name: str, args: argparse.Namespace):
+    # a fresh process per run so that peak RSS is not shared between them
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(evaluate, backend_name, args).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare accuracy, latency and memory of the classifier backends')
+    parser.add_argument('--csv', default='validation.csv')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--model-name', default='monologg/koelectra-base-v3-discriminator')
+    parser.add_argument('--weights', default='model.pt')
+    parser.add_argument('--onnx', default='model.onnx')
+    parser.add_argument('--onnx-int8', default='model.int8.onnx')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--latency-samples', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--max-accuracy-delta', type=float, default=0.01)
+    args = parser.parse_args()
+
+    reports = [evaluate_isolated(backend_name, args) for backend_name in args.backends]
+
+    print(f'{"backend":<12} {"accuracy":>9} {"p50 ms":>8} {"p99 ms":>8} {"RSS MB":>8}')
+    for report in reports:
+        print(f'{report["backend"]:<12} {report["accuracy"]:>9.4f} {report["p50_ms"]:>8.2f} {report["p99_ms"]:>8.2f} {report["rss_mb"]:>8.1f}')
+
+    baseline = next((report for report in reports if report['backend'] == 'torch-eager'), None)
+    if baseline is None:
+        return
+    for report in reports:
+        if report is baseline:
+            continue
+        accepted = (
+            baseline['accuracy'] - report['accuracy'] <= args.max_accuracy_delta
+            and report['p50_ms'] < baseline['p50_ms']
+            and report['p99_ms'] < baseline['p99_ms']
+            and report['rss_mb'] < baseline['rss_mb']
+        )
+        print(f'[parity] {report["backend"]}: {"switch" if accepted else "keep torch-eager"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import csv
+import zlib
+
+import numpy as np
+
+
+NUM_BUCKETS = 2 ** 18
+NGRAM_SIZES = (1, 2, 3)
+NONE_LABEL = 0
+
+
+def featurize(text: str):
+    text = f' {" ".join(text.casefold().split())} '
+    buckets = {zlib.crc32(text[i:i + n].encode()) % NUM_BUCKETS for n in NGRAM_SIZES for i in range(len(text) - n + 1)}
+    return np.fromiter(buckets, dtype=np.int64, count=len(buckets))
+
+
+def sigmoid(x: float | np.ndarray):
+    return 1 / (1 + np.exp(-x))
+
+
+class Prefilter:
+    def __init__(self, weights: np.ndarray, bias: float, positive_scores: np.ndarray, recall: float = 0.99):
+        self.weights = weights
+        self.bias = bias
+        self.positive_scores = np.sort(positive_scores)
+        self.threshold = 0.0
+        self.set_recall(recall)
+
+    @classmethod
+    def load(cls, path: str, recall: float = 0.99):
+        with np.load(path) as npz:
+            return cls(npz['weights'], float(npz['bias']), npz['positive_scores'], recall)
+
+    def save(self, path: str):
+        np.savez_compressed(path, weights=self.weights, bias=self.bias, positive_scores=self.positive_scores)
+
+    def set_recall(self, recall: float):
+        # the threshold keeps `recall` of the held-out intent messages above it
+        if len(self.positive_scores):
+            self.threshold = float(np.quantile(self.positive_scores, 1 - recall))
+
+    def score(self, text: str):
+        buckets = featurize(text)
+        if not len(buckets):
+            return 0.0
+        return float(sigmoid(self.weights[buckets].sum() / np.sqrt(len(buckets)) + self.bias))
+
+    def is_none(self, text: str):
+        return self.score(text) < self.threshold
+
+
+def load_csv(csv_file: str):
+    # same cleaning as DiscordCmdDataset in train.ipynb: drop empty rows and duplicate sentences, labels are 1-based
+    texts, labels, seen = [], [], set()
+    with open(csv_file, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            sentence, label = row[0], row[1]
+            if not sentence or not label or sentence in seen:
+                continue
+            seen.add(sentence)
+            texts.append(sentence)
+            labels.append(int(float(label)) - 1)
+    return texts, labels
+
+
+def train(texts: list[str], labels: list[int], epochs: int = 5, lr: float = 0.5, l2: float = 1e-6, seed: int = 0):
+    features = [featurize(text) for text in texts]
+    targets = np.array([label != NONE_LABEL for label in labels], dtype=np.float32)
+    weights = np.zeros(NUM_BUCKETS, dtype=np.float32)
+    bias = 0.0
+
+    rng = np.random.default_rng(seed)
+    for epoch in range(epochs):
+        total_loss = 0.0
+        for i in rng.permutation(len(features)):
+            buckets = features[i]
+            if not len(buckets):
+                continue
+            scale = 1 / np.sqrt(len(buckets))
+            p = sigmoid(weights[buckets].sum() * scale + bias)
+            grad = p - targets[i]
+            weights[buckets] -= lr * (grad * scale + l2 * weights[buckets])
+            bias -= lr * grad
+            total_loss -= np.log((p if targets[i] else 1 - p) + 1e-12)
+        print(f'Epoch {epoch + 1}/{epochs}, Loss: {total_loss / len(features):.4f}')
+
+    return weights, bias
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the hashed character n-gram prefilter used by the NLP cog')
+    parser.add_argument('--train', default='train.csv')
+    parser.add_argument('--validation', default='validation.csv')
+    parser.add_argument('--output', default='prefilter.npz')
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--recall', type=float, default=0.99)
+    args = parser.parse_args()
+
+    weights, bias = train(*load_csv(args.train), epochs=args.epochs)
+
+    texts, labels = load_csv(args.validation)
+    prefilter = Prefilter(weights, bias, np.array([]))
+    scores = np.array([prefilter.score(text) for text in texts])
+    is_intent = np.array([label != NONE_LABEL for label in labels])
+    prefilter = Prefilter(weights, bias, scores[is_intent], args.recall)
+    prefilter.save(args.output)
+
+    short_circuited = scores < prefilter.threshold
+    print(f'threshold: {prefilter.threshold:.4f}')
+    print(f'intent recall: {1 - short_circuited[is_intent].mean():.4f}')
+    print(f'short-circuited "None" messages: {short_circuited[~is_intent].mean():.4f}')
+
+
+if __name__ == '__main__':
+    main()
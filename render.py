@@ -0,0 +1,53 @@
+import asyncio
+from typing import Awaitable, Callable
+
+import discord
+
+
+class RenderScheduler:
+    # Discord allows about 5 message edits per 5 seconds per channel
+    def __init__(self, bucket_size: int = 5, bucket_period_s: float = 5):
+        self.bucket_size = bucket_size
+        self.refill_s = bucket_period_s / bucket_size
+        self.tokens = float(bucket_size)
+        self.refilled_at: float = None
+        self.render: Callable[[], Awaitable] = None
+        self.dirty = False
+        self.task: asyncio.Task = None
+        self.sent = 0
+        self.coalesced = 0
+
+    def request(self, loop: asyncio.AbstractEventLoop, render: Callable[[], Awaitable]):
+        # safe to call from the voice player thread, the state is only touched on the loop
+        loop.call_soon_threadsafe(self.mark_dirty, render)
+
+    def mark_dirty(self, render: Callable[[], Awaitable]):
+        if self.dirty:
+            self.coalesced += 1
+        self.render = render
+        self.dirty = True
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while self.dirty:
+            now = loop.time()
+            if self.refilled_at is not None:
+                self.tokens = min(self.bucket_size, self.tokens + (now - self.refilled_at) / self.refill_s)
+            self.refilled_at = now
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) * self.refill_s)
+                continue
+
+            # at most one edit in flight, it renders whatever the state is when it starts
+            self.tokens -= 1
+            self.dirty = False
+            try:
+                await self.render()
+                self.sent += 1
+            except discord.HTTPException as e:
+                print(f'[RenderScheduler] {e}')
+
+    def get_stats(self):
+        return {'sent': self.sent, 'coalesced': self.coalesced}
@@ -1,54 +1,211 @@
+import argparse
 import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing.connection import Connection
 
 import discord
 from discord.ext import commands
 
 import config
+import local_inference
+from audio_cache import AudioCache
+from caution_ledger import CautionLedger
+from cluster import ClusterClient, ClusterLauncher, fetch_shard_count, split_shards
+from extraction import ExtractionService
+from guild_state import GuildStateStore
+from intent_bus import IntentBus
+from song_cache import SongCache
 
 
 TEST_GUILD_ID_LIST = [discord.Object(id=1202849468681289728), discord.Object(id=1229731635730059325), discord.Object(id=553237519991570453)]
 
+# 'remote' asks the inference server in main.py, 'local' runs the classifier in a process pool owned by the bot
+NLP_BACKEND = 'remote'
+NLP_POOL_WORKERS = 1
+NLP_POOL_THREADS = 2
+NLP_MODEL_BACKEND = 'torch-eager'
+NLP_MODEL_NAME = 'monologg/koelectra-base-v3-discriminator'
+NLP_MODEL_PATH = 'model.pt'
+NLP_ONNX_PATH = 'model.onnx'
+NLP_ONNX_INT8_PATH = 'model.int8.onnx'
 
-class NLPBot(commands.Bot):
-    def __init__(self, command_prefix, *, intents: discord.Intents):
-        super().__init__(command_prefix, intents=intents)
-        self.data: dict[int, dict[str, bool | int | float | list[dict[str, str]] | dict[discord.Member, int] | dict[str, discord.Message]]] = {}
-        self.history: dict[str, dict[str, str]] = {}
+# Song metadata shared by every guild, the least recently used songs are dropped past SONG_CACHE_MAX_ENTRIES
+SONG_CACHE_PATH = 'songs.db'
+SONG_CACHE_MAX_ENTRIES = 50000
+
+# yt-dlp runs in its own processes so that extractor parsing does not hold the GIL of the gateway loop
+YTDLP_WORKERS = 2
+
+# Songs played once are kept on disk up to AUDIO_CACHE_MAX_BYTES, setting AUDIO_CACHE_DIR to None turns the cache off
+AUDIO_CACHE_DIR = 'audio_cache'
+AUDIO_CACHE_MAX_BYTES = 10 * 2 ** 30
+
+# Volume, repeat mode, queues and NLP toggles are written here every GUILD_STATE_FLUSH_INTERVAL_S and restored on restart
+GUILD_STATE_PATH = 'guilds.db'
+GUILD_STATE_FLUSH_INTERVAL_S = 30
+
+# Every caution ever given, by guild and member
+CAUTION_LEDGER_PATH = 'cautions.db'
+
+# Hash of the command tree last pushed to each test guild, a guild is only synced again when its hash changes
+COMMAND_TREE_HASH_PATH = 'command_tree.json'
+
+# --clusters N spreads the shards over N processes, None asks Discord for the recommended shard count
+CLUSTER_SHARD_COUNT = None
+
+
+class NLPBot(commands.AutoShardedBot):
+    def __init__(self, command_prefix, *, intents: discord.Intents, cluster: ClusterClient = None, cluster_count: int = 1, **options):
+        super().__init__(command_prefix, intents=intents, **options)
+        self.started_at = time.perf_counter()
+        # milliseconds per startup phase, phases that overlap are timed separately
+        self.startup_phases: dict[str, float] = {}
+        self.ready_logged = False
+        self.cluster = cluster
+        self.intent_bus = IntentBus()
+        self.history = SongCache(SONG_CACHE_PATH, max_entries=SONG_CACHE_MAX_ENTRIES)
+        # a guild's state is created on first use, every cluster only ever uses the guilds of its own shards
+        self.data = GuildStateStore(GUILD_STATE_PATH, self.history, flush_interval_s=GUILD_STATE_FLUSH_INTERVAL_S)
+        self.cautions = CautionLedger(CAUTION_LEDGER_PATH)
+        self.nlp_pool: ProcessPoolExecutor = None
+        self.extractor = ExtractionService(YTDLP_WORKERS)
+        self.audio_cache = None
+        if AUDIO_CACHE_DIR is not None:
+            if cluster is None:
+                self.audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES)
+            else:
+                # a guild always lands on the same cluster, so each cluster keeps its own share of the disk budget
+                self.audio_cache = AudioCache(os.path.join(AUDIO_CACHE_DIR, f'cluster-{cluster.cluster_id}'), AUDIO_CACHE_MAX_BYTES // cluster_count)
 
     async def setup_hook(self):
-        for cog in config.cogs_list:
-            await self.load_extension(f'cogs.{cog}')
+        with self.measure_phase('guild state'):
+            await asyncio.to_thread(self.data.load)
+        self.data.start()
+
+        if self.cluster is not None:
+            self.cluster.start(self)
+
+        # the cogs do not depend on each other or on the NLP pool, so they all load while the pool warms up
+        phases = [self.load_cogs(), self.load_title_index()]
+        if NLP_BACKEND == 'local':
+            phases.append(self.start_nlp_pool())
+        await asyncio.gather(*phases)
+
+        # the command tree is the same in every cluster, so only the first one syncs it
+        if self.cluster is None or self.cluster.cluster_id == 0:
+            with self.measure_phase('command sync'):
+                await self.sync_command_tree()
+
+        for phase, ms in self.startup_phases.items():
+            print(f'[setup_hook] {phase}: {ms:.0f}ms')
+
+    @contextmanager
+    def measure_phase(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_phases[phase] = (time.perf_counter() - start) * 1000
 
-        for id in TEST_GUILD_ID_LIST:
-            self.tree.copy_global_to(guild=id)
-            await self.tree.sync(guild=id)
+    async def load_cogs(self):
+        async def load(cog: str):
+            with self.measure_phase(f'cogs.{cog}'):
+                await self.load_extension(f'cogs.{cog}')
+
+        with self.measure_phase('cogs'):
+            await asyncio.gather(*[load(cog) for cog in config.cogs_list])
+
+    async def load_title_index(self):
+        # built before the first autocomplete, so no user waits on it
+        with self.measure_phase('title index'):
+            await asyncio.to_thread(self.history.load_index)
+
+    async def sync_command_tree(self):
+        hashes = {}
+        if os.path.exists(COMMAND_TREE_HASH_PATH):
+            with open(COMMAND_TREE_HASH_PATH) as f:
+                hashes = json.load(f)
+
+        changed = []
+        for guild in TEST_GUILD_ID_LIST:
+            self.tree.copy_global_to(guild=guild)
+            payload = sorted((command.to_dict(self.tree) for command in self.tree.get_commands(guild=guild)), key=lambda command: command['name'])
+            digest = hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+            # keyed by application as well, so switching tokens never skips a sync
+            key = f'{self.application_id}:{guild.id}'
+            if hashes.get(key) != digest:
+                hashes[key] = digest
+                changed.append(guild)
+
+        if not changed:
+            print('[sync_command_tree] command tree unchanged, sync skipped')
+            return
+        await asyncio.gather(*[self.tree.sync(guild=guild) for guild in changed])
+        with open(COMMAND_TREE_HASH_PATH, 'w') as f:
+            json.dump(hashes, f, indent=4)
+        print(f'[sync_command_tree] synced {len(changed)} guilds')
+
+    async def start_nlp_pool(self):
+        self.nlp_pool = ProcessPoolExecutor(
+            max_workers=NLP_POOL_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=local_inference.init_worker,
+            initargs=(NLP_MODEL_BACKEND, NLP_MODEL_NAME, NLP_MODEL_PATH, NLP_ONNX_PATH, NLP_ONNX_INT8_PATH, NLP_POOL_THREADS),
+        )
+        with self.measure_phase('NLP pool'):
+            await asyncio.gather(*[self.loop.run_in_executor(self.nlp_pool, local_inference.warm_up) for _ in range(NLP_POOL_WORKERS)])
+        print(f'NLP pool ready ({NLP_POOL_WORKERS} workers)')
+
+    async def close(self):
+        await super().close()
+        await self.data.close()
+        self.history.close()
+        if self.cluster is not None:
+            self.cluster.close()
+        self.extractor.shutdown()
+        if self.audio_cache is not None:
+            self.audio_cache.close()
+        if self.nlp_pool is not None:
+            self.nlp_pool.shutdown(cancel_futures=True)
 
     async def on_ready(self):
-        for guild in self.guilds:
-            self.initialize_guild_data(guild.id)
+        if not self.ready_logged:
+            self.ready_logged = True
+            print(f'[on_ready] ready {time.perf_counter() - self.started_at:.1f}s after start')
         print(f'Logged in as {self.user} (ID: {self.user.id})')
         print('------')
 
-    async def on_guild_join(self, guild: discord.Guild):
-        self.initialize_guild_data(guild.id)
-
-    def initialize_guild_data(self, guild_id: int):
-        if guild_id not in self.data:
-            self.data[guild_id] = {}
-            self.data[guild_id]['NLP'] = True
-            self.data[guild_id]['repeat'] = 0
-            self.data[guild_id]['volume'] = 0.1
-            self.data[guild_id]['playlist'] = []
-            self.data[guild_id]['caution_dict'] = {}
-            self.data[guild_id]['sent_msg'] = {}
-
 
-async def main():
+async def main(cluster: ClusterClient = None, cluster_count: int = 1, **options):
     intents = discord.Intents.default()
     intents.message_content = True
-    async with NLPBot(commands.when_mentioned, intents=intents) as bot:
+    async with NLPBot(commands.when_mentioned, intents=intents, cluster=cluster, cluster_count=cluster_count, **options) as bot:
         await bot.start(config.token)
 
 
+def run_cluster(cluster_id: int, shard_ids: list[int], shard_count: int, cluster_count: int, connection: Connection):
+    cluster = ClusterClient(cluster_id, connection)
+    try:
+        asyncio.run(main(cluster, cluster_count, shard_ids=shard_ids, shard_count=shard_count))
+    except KeyboardInterrupt:
+        pass
+
+
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Run the bot, optionally as several processes that each own a range of shards')
+    parser.add_argument('--clusters', type=int, default=1, help='number of processes to spread the shards over')
+    parser.add_argument('--shards', type=int, default=CLUSTER_SHARD_COUNT, help='total shard count, defaults to the count Discord recommends')
+    args = parser.parse_args()
+
+    if args.clusters == 1:
+        asyncio.run(main())
+    else:
+        shard_count = args.shards or fetch_shard_count(config.token)
+        shard_ranges = split_shards(shard_count, args.clusters)
+        ClusterLauncher(run_cluster, shard_ranges, shard_count).run()
\ No newline at end of file
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import queue
+import random
+
+from aiohttp import web
+
+from main import CLASSIFY_MAX_MESSAGES, CONFIDENCE_THRESHOLD, GPT_BUDGET_S, get_stats, gpt_worker, parse_messages, reset_stats_state, submit_sentiment, to_classify_response
+
+
+HOST = '0.0.0.0'
+PORT = 5000
+
+
+async def predict_sentiment(text: str):
+    future = submit_sentiment(text)
+    if future.done():
+        return future.result()
+    return await asyncio.wrap_future(future)
+
+
+async def index(request: web.Request):
+    message = request.query.get('message', '')
+    if message:
+        sentiment_class, sentiment_prob = await predict_sentiment(message)
+        if sentiment_prob < CONFIDENCE_THRESHOLD:
+            try:
+                async with asyncio.timeout(GPT_BUDGET_S):
+                    return web.Response(text=await asyncio.wrap_future(gpt_worker.submit(message)))
+            except (queue.Full, TimeoutError):
+                response_type = 0
+        else:
+            response_type = sentiment_class
+    else:
+        response_type = random.randint(0, 4)
+
+    return web.Response(text=str(response_type))
+
+
+async def classify(request: web.Request):
+    try:
+        messages = parse_messages(await request.json())
+    except json.JSONDecodeError:
+        messages = None
+    if messages is None:
+        return web.json_response({'error': 'expected a JSON array of strings'}, status=400)
+    if len(messages) > CLASSIFY_MAX_MESSAGES:
+        return web.json_response({'error': f'at most {CLASSIFY_MAX_MESSAGES} messages per request'}, status=413)
+
+    results = await asyncio.gather(*[predict_sentiment(message) for message in messages])
+    return web.json_response(to_classify_response(results))
+
+
+async def generate(request: web.Request):
+    message = request.query.get('message', '')
+    if not message:
+        return web.json_response({'error': 'message is required'}, status=400)
+
+    loop = asyncio.get_running_loop()
+    chunks = gpt_worker.stream(message)
+    try:
+        chunk = await loop.run_in_executor(None, next, chunks, None)
+    except queue.Full:
+        return web.json_response({'error': 'too many generations in progress'}, status=503)
+
+    response = web.StreamResponse(headers={'Content-Type': 'text/plain; charset=utf-8'})
+    await response.prepare(request)
+    while chunk is not None:
+        await response.write(chunk.encode())
+        chunk = await loop.run_in_executor(None, next, chunks, None)
+    await response.write_eof()
+    return response
+
+
+async def stats(request: web.Request):
+    return web.json_response(get_stats())
+
+
+async def reset_stats(request: web.Request):
+    reset_stats_state()
+    return web.json_response(get_stats())
+
+
+def create_app():
+    app = web.Application()
+    app.router.add_get('/', index)
+    app.router.add_post('/classify', classify)
+    app.router.add_get('/generate', generate)
+    app.router.add_get('/stats', stats)
+    app.router.add_post('/stats/reset', reset_stats)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host=HOST, port=PORT)
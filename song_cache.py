@@ -0,0 +1,199 @@
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from urllib import parse
+
+from title_index import TitleIndex
+
+
+class Song:
+    __slots__ = ('id', 'title', 'length', 'url', 'thumbnail', 'artist', '__weakref__')
+
+    def __init__(self, id: str, title: str, length: str, url: str, thumbnail: str, artist: str = None):
+        self.id = sys.intern(id)
+        self.title = title
+        self.length = sys.intern(length)
+        self.url = url
+        self.thumbnail = thumbnail
+        self.artist = sys.intern(artist) if artist is not None else None
+
+    def update(self, title: str, length: str, url: str, thumbnail: str, artist: str = None):
+        self.title = title
+        self.length = sys.intern(length)
+        self.url = url
+        self.thumbnail = thumbnail
+        self.artist = sys.intern(artist) if artist is not None else None
+
+
+class SongCache:
+    def __init__(self, path: str, max_entries: int = 50000, source_ttl_s: float = 5 * 60 * 60, source_margin_s: float = 10 * 60, touch_batch_size: int = 256):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_batch_size = touch_batch_size
+        self.source_ttl_s = source_ttl_s
+        self.source_margin_s = source_margin_s
+        self.connection: sqlite3.Connection = None
+        self.size = 0
+        self.lock = threading.RLock()
+        # every queue in every guild holds the same Song object for a given id while any of them still references it
+        self.songs: weakref.WeakValueDictionary[str, Song] = weakref.WeakValueDictionary()
+        self.index: TitleIndex = None
+        # last_used updates wait here and are written in one transaction, before any eviction reads the order
+        self.touched: dict[str, float] = {}
+
+    def connect(self):
+        # opened on first use, so that bots that never play music never touch the file
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.executescript('''
+                CREATE TABLE IF NOT EXISTS songs (
+                    id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    length TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    thumbnail TEXT NOT NULL,
+                    artist TEXT,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS songs_last_used ON songs (last_used);
+                CREATE TABLE IF NOT EXISTS sources (
+                    id TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+            ''')
+            self.size = self.connection.execute('SELECT COUNT(*) FROM songs').fetchone()[0]
+        return self.connection
+
+    def __contains__(self, id: str):
+        return self.get(id) is not None
+
+    def get(self, id: str):
+        with self.lock:
+            connection = self.connect()
+            song = self.songs.get(id)
+            if song is not None:
+                self.touch(id)
+                return song
+
+            row = connection.execute('SELECT id, title, length, url, thumbnail, artist FROM songs WHERE id = ?', (id,)).fetchone()
+            if row is None:
+                return None
+            self.touch(id)
+            song = Song(*row)
+            self.songs[song.id] = song
+            return song
+
+    def touch(self, id: str):
+        self.touched[id] = time.time()
+        if self.index is not None:
+            self.index.touch(id)
+        if len(self.touched) >= self.touch_batch_size:
+            self.flush_touched()
+
+    def flush_touched(self):
+        with self.lock:
+            if self.touched:
+                connection = self.connect()
+                with connection:
+                    connection.execute('BEGIN')
+                    self.write_touched(connection)
+
+    def write_touched(self, connection: sqlite3.Connection):
+        connection.executemany('UPDATE songs SET last_used = ? WHERE id = ?', [(last_used, id) for id, last_used in self.touched.items()])
+        self.touched.clear()
+
+    def close(self):
+        self.flush_touched()
+
+    def get_many(self, ids: list[str]):
+        # one SELECT per chunk of ids and no last_used update, for restoring saved queues without touching the LRU order
+        songs = {}
+        with self.lock:
+            connection = self.connect()
+            missing = []
+            for id in dict.fromkeys(ids):
+                song = self.songs.get(id)
+                if song is not None:
+                    songs[id] = song
+                else:
+                    missing.append(id)
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows = connection.execute(f'SELECT id, title, length, url, thumbnail, artist FROM songs WHERE id IN ({", ".join("?" * len(chunk))})', chunk)
+                for row in rows:
+                    song = Song(*row)
+                    self.songs[song.id] = song
+                    songs[song.id] = song
+        return songs
+
+    def put(self, info: dict[str, str]):
+        with self.lock:
+            # a song already held by some queue is updated in place, so every queue keeps seeing one object
+            song = self.songs.get(info['id'])
+            if song is None:
+                song = Song(info['id'], info['title'], info['length'], info['url'], info['thumbnail'], info.get('artist'))
+                self.songs[song.id] = song
+            else:
+                song.update(info['title'], info['length'], info['url'], info['thumbnail'], info.get('artist'))
+            connection = self.connect()
+            self.touched.pop(song.id, None)
+            values = (song.title, song.length, song.url, song.thumbnail, song.artist, time.time(), song.id)
+            evicted = []
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                if connection.execute('UPDATE songs SET title = ?, length = ?, url = ?, thumbnail = ?, artist = ?, last_used = ? WHERE id = ?', values).rowcount == 0:
+                    connection.execute('INSERT INTO songs (title, length, url, thumbnail, artist, last_used, id) VALUES (?, ?, ?, ?, ?, ?, ?)', values)
+                    # every cluster writes to the same file, so the size is counted inside the transaction instead of per process
+                    self.size = connection.execute('SELECT COUNT(*) FROM songs').fetchone()[0]
+                    if self.size > self.max_entries:
+                        self.write_touched(connection)
+                        evicted = [(row[0],) for row in connection.execute('SELECT id FROM songs ORDER BY last_used LIMIT ?', (self.size - self.max_entries,))]
+                        connection.executemany('DELETE FROM songs WHERE id = ?', evicted)
+                        connection.executemany('DELETE FROM sources WHERE id = ?', evicted)
+                        self.size -= len(evicted)
+            if self.index is not None:
+                self.index.add(song.id, song.title, song.artist, song.url)
+                for id, in evicted:
+                    self.index.remove(id)
+            if 'source' in info:
+                self.put_source(song.id, info['source'])
+        return song
+
+    def load_index(self):
+        # built from the whole history once, the bot does it on a thread at startup, then kept up to date by get and put
+        with self.lock:
+            if self.index is None:
+                index = TitleIndex()
+                for id, title, artist, url in self.connect().execute('SELECT id, title, artist, url FROM songs ORDER BY last_used'):
+                    index.add(id, title, artist, url)
+                self.index = index
+            return self.index
+
+    def search(self, query: str, limit: int = 25):
+        with self.lock:
+            return self.load_index().search(query, limit)
+
+    def get_source(self, id: str):
+        with self.lock:
+            row = self.connect().execute('SELECT source, expires_at FROM sources WHERE id = ?', (id,)).fetchone()
+        if row is None or row[1] - self.source_margin_s < time.time():
+            return None
+        return row[0]
+
+    def put_source(self, id: str, source: str):
+        with self.lock:
+            connection = self.connect()
+            connection.execute('DELETE FROM sources WHERE expires_at < ?', (time.time(),))
+            connection.execute('INSERT OR REPLACE INTO sources (id, source, expires_at) VALUES (?, ?, ?)', (id, source, self.get_source_expiry(source)))
+
+    def get_source_expiry(self, source: str):
+        # googlevideo stream URLs carry their own expiry as a unix timestamp in the 'expire' parameter
+        expire = parse.parse_qs(parse.urlparse(source).query).get('expire')
+        if expire and expire[0].isdigit():
+            return float(expire[0])
+        return time.time() + self.source_ttl_s
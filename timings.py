@@ -0,0 +1,45 @@
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class StageTimings:
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        self.samples: dict[str, deque[float]] = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000)
+
+    def record(self, stage: str, ms: float):
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.max_samples)
+            self.samples[stage].append(ms)
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+
+    def get_summary(self):
+        with self.lock:
+            samples = {stage: list(values) for stage, values in self.samples.items()}
+
+        summary = {}
+        for stage, values in samples.items():
+            quantiles = statistics.quantiles(values, n=100, method='inclusive') if len(values) > 1 else values * 99
+            summary[stage] = {
+                'count': len(values),
+                'p50_ms': quantiles[49],
+                'p95_ms': quantiles[94],
+                'p99_ms': quantiles[98],
+            }
+        return summary
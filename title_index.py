@@ -0,0 +1,143 @@
+import heapq
+import re
+import unicodedata
+from array import array
+
+
+NON_WORD = re.compile(r'[\W_]+')
+# A keyword that starts a title has to be at least this long, and cover this much of the title, to count as naming it
+STRONG_MATCH_MIN_CHARS = 4
+STRONG_MATCH_MIN_RATIO = 0.6
+
+
+def normalize(text: str):
+    # 'IU - 좋은 날 (Good Day)' and 'iu 좋은 날 good day' share a key
+    return NON_WORD.sub(' ', unicodedata.normalize('NFKC', text).casefold()).strip()
+
+
+class IndexEntry:
+    __slots__ = ('id', 'title', 'artist', 'url', 'text', 'compact', 'recency')
+
+    def __init__(self, id: str, title: str, artist: str, url: str, recency: int):
+        self.id = id
+        self.title = title
+        self.artist = artist
+        self.url = url
+        self.text = normalize(title if artist is None else f'{title} {artist}')
+        # spaces are dropped for matching, so '좋은날' finds '좋은 날'
+        self.compact = self.text.replace(' ', '')
+        self.recency = recency
+
+    def is_strong_match(self, query: str):
+        # the whole title, title and artist in either order, or a start that covers most of the title
+        compact = normalize(query).replace(' ', '')
+        if not compact:
+            return False
+        title = normalize(self.title).replace(' ', '')
+        if compact == title or compact == self.compact:
+            return True
+        if self.artist is not None and compact == normalize(f'{self.artist} {self.title}').replace(' ', ''):
+            return True
+        return len(compact) >= max(STRONG_MATCH_MIN_CHARS, STRONG_MATCH_MIN_RATIO * len(title)) and title.startswith(compact)
+
+
+class TitleIndex:
+    def __init__(self, gram_size: int = 3):
+        self.gram_size = gram_size
+        self.entries: list[IndexEntry] = []
+        self.positions: dict[str, int] = {}
+        # postings are append-only arrays of entry positions, entries that are replaced or removed are left as None
+        self.grams: dict[str, array] = {}
+        self.prefixes: dict[str, array] = {}
+        self.dead = 0
+        self.clock = 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get_grams(self, compact: str):
+        return {compact[i:i + self.gram_size] for i in range(len(compact) - self.gram_size + 1)}
+
+    def get_prefixes(self, text: str):
+        # queries shorter than a gram are matched against the start of each word instead
+        return {word[:length] for word in text.split() for length in range(1, self.gram_size)}
+
+    def add(self, id: str, title: str, artist: str = None, url: str = None):
+        self.clock += 1
+        position = self.positions.get(id)
+        if position is not None:
+            entry = self.entries[position]
+            if entry.title == title and entry.artist == artist:
+                entry.recency = self.clock
+                return
+            self.entries[position] = None
+            self.dead += 1
+
+        entry = IndexEntry(id, title, artist, url, self.clock)
+        position = len(self.entries)
+        self.entries.append(entry)
+        self.positions[id] = position
+        for gram in self.get_grams(entry.compact):
+            self.grams.setdefault(gram, array('I')).append(position)
+        for prefix in self.get_prefixes(entry.text):
+            self.prefixes.setdefault(prefix, array('I')).append(position)
+        self.compact_if_needed()
+
+    def touch(self, id: str):
+        position = self.positions.get(id)
+        if position is not None:
+            self.clock += 1
+            self.entries[position].recency = self.clock
+
+    def remove(self, id: str):
+        position = self.positions.pop(id, None)
+        if position is not None:
+            self.entries[position] = None
+            self.dead += 1
+            self.compact_if_needed()
+
+    def compact_if_needed(self):
+        if self.dead < 1000 or self.dead < len(self.positions):
+            return
+        entries = sorted((entry for entry in self.entries if entry is not None), key=lambda entry: entry.recency)
+        self.entries = []
+        self.positions = {}
+        self.grams = {}
+        self.prefixes = {}
+        self.dead = 0
+        clock = self.clock
+        for entry in entries:
+            self.clock = entry.recency - 1
+            self.add(entry.id, entry.title, entry.artist, entry.url)
+        self.clock = clock
+
+    def search(self, query: str, limit: int = 25):
+        text = normalize(query)
+        compact = text.replace(' ', '')
+        if not compact:
+            return heapq.nlargest(limit, (entry for entry in self.entries if entry is not None), key=lambda entry: entry.recency)
+
+        if len(compact) < self.gram_size:
+            postings = [self.prefixes.get(compact)]
+        else:
+            postings = [self.grams.get(gram) for gram in self.get_grams(compact)]
+        if any(posting is None for posting in postings):
+            return []
+
+        # only the rarest gram is scanned, every candidate is then checked against the whole query
+        matches = []
+        for position in min(postings, key=len):
+            entry = self.entries[position]
+            if entry is not None and compact in entry.compact:
+                matches.append(entry)
+
+        spaced = f' {text}'
+
+        def rank(entry: IndexEntry):
+            if entry.compact.startswith(compact):
+                return (0, -entry.recency)
+            if spaced in f' {entry.text}':
+                return (1, -entry.recency)
+            return (2, -entry.recency)
+
+        return heapq.nsmallest(limit, matches, key=rank)
@@ -0,0 +1,120 @@
+import random
+from collections import deque
+
+from song_cache import Song
+
+
+class Track:
+    __slots__ = ('song', 'requester_id')
+
+    def __init__(self, song: Song, requester_id: int):
+        self.song = song
+        self.requester_id = requester_id
+
+
+class TrackQueue:
+    def __init__(self):
+        self.tracks: deque[Track] = deque()
+        # bumped by every edit, so the guild state store can tell which queues changed since the last save
+        self.version = 0
+        # pages are sliced out of a list copy that survives track changes, only the other edits drop it
+        self.view: list[Track] = None
+        self.view_offset = 0
+        self.view_rotating = False
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __bool__(self):
+        return bool(self.tracks)
+
+    def __iter__(self):
+        return iter(self.tracks)
+
+    @property
+    def head(self):
+        return self.tracks[0] if self.tracks else None
+
+    def peek(self, index: int):
+        return self.tracks[index] if index < len(self.tracks) else None
+
+    def slice(self, start: int, stop: int):
+        # the queue is view[view_offset:] while tracks are dropped, and view rotated by view_offset while they are rotated
+        if self.view is None:
+            self.view = list(self.tracks)
+            self.view_offset = 0
+            self.view_rotating = False
+        if self.view_rotating:
+            size = len(self.view)
+            return [self.view[(self.view_offset + i) % size] for i in range(start, min(stop, size))]
+        return self.view[self.view_offset + start:self.view_offset + stop]
+
+    def edited(self):
+        self.version += 1
+        self.view = None
+
+    def append(self, track: Track):
+        self.tracks.append(track)
+        self.version += 1
+        if self.view is not None and not self.view_rotating:
+            self.view.append(track)
+        else:
+            self.view = None
+
+    def advance(self, repeat: int):
+        # repeat 0 drops the finished track, 1 and 2 send it to the back of the queue
+        if repeat == 0:
+            self.tracks.popleft()
+        else:
+            self.tracks.rotate(-1)
+        self.version += 1
+        if self.view is None:
+            return
+        if self.view_offset == 0:
+            self.view_rotating = repeat != 0
+        if self.view_rotating != (repeat != 0):
+            # the repeat mode changed between tracks, the next slice copies the queue again
+            self.view = None
+            return
+        self.view_offset += 1
+        if self.view_rotating:
+            self.view_offset %= len(self.view)
+        elif self.view_offset > len(self.tracks):
+            # dropped tracks are let go once they outnumber the queue, so the copy stays amortized O(1) per track
+            self.view = None
+
+    def shuffle(self, keep_head: bool = True):
+        # the head is the playing track, it stays where it is
+        tracks = list(self.tracks)
+        start = 1 if keep_head else 0
+        rest = tracks[start:]
+        random.shuffle(rest)
+        self.tracks = deque(tracks[:start] + rest)
+        self.edited()
+
+    def remove_at(self, index: int):
+        track = self.tracks[index]
+        del self.tracks[index]
+        self.edited()
+        return track
+
+    def move(self, source: int, destination: int):
+        track = self.remove_at(source)
+        self.tracks.insert(destination, track)
+        self.view = None
+
+    def dedupe(self):
+        seen = set()
+        tracks = deque()
+        for track in self.tracks:
+            if track.song.id not in seen:
+                seen.add(track.song.id)
+                tracks.append(track)
+        removed = len(self.tracks) - len(tracks)
+        self.tracks = tracks
+        self.edited()
+        return removed
+
+    def clear(self):
+        self.tracks.clear()
+        self.edited()